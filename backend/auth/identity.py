@@ -0,0 +1,126 @@
+"""
+Script Name : identity.py
+Description : Resolve the authenticated user from JWT claims, with an optional cache
+Author      : @tonybnya
+"""
+
+import threading
+import time
+from flask import current_app, jsonify
+from flask_jwt_extended import get_jwt, get_jwt_header
+from flask_jwt_extended.exceptions import UserLookupError
+from sqlalchemy import select
+from core import db
+from users.models import User
+
+
+def token_claims(user):
+    """Authorization claims embedded in the access token at login."""
+    return {"is_admin": user.is_admin, "is_active": user.is_active}
+
+
+class UserFlagsCache:
+    """Per-process TTL cache of {user_id: {"is_admin", "is_active"}}."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            return entry[1]
+
+    def put(self, user_id, flags, ttl):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + ttl, flags)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserFlagsCache()
+
+
+class CurrentUser:
+    """The authenticated user of a request.
+
+    `id`, `is_admin` and `is_active` are known without a query; any other
+    attribute loads the User row, at most once per request. A user deleted
+    while their flags were cached ends the request with a 401.
+    """
+
+    def __init__(self, user_id, is_admin, is_active):
+        self.id = user_id
+        self.is_admin = is_admin
+        self.is_active = is_active
+        self._user = None
+
+    @property
+    def model(self):
+        if self._user is None:
+            self._user = db.session.get(User, self.id)
+            if self._user is None:
+                raise UserLookupError(
+                    "User not found or inactive", get_jwt_header(), get_jwt()
+                )
+        return self._user
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+def _load_flags(user_id):
+    row = db.session.execute(
+        select(User.is_admin, User.is_active).where(User.id == user_id)
+    ).first()
+    if row is None:
+        return None
+    return {"is_admin": row.is_admin, "is_active": row.is_active}
+
+
+def resolve_flags(user_id, jwt_data):
+    """Return the authorization flags of `user_id`, or None if it is gone.
+
+    The flags come from the DB, cached per process for AUTH_USER_CACHE_TTL
+    seconds, so demotions and deactivations apply within the TTL. With a
+    TTL of 0 the token claims are trusted until the token expires instead;
+    tokens issued before the claims existed fall back to a lookup.
+    """
+    ttl = current_app.config["AUTH_USER_CACHE_TTL"]
+    if ttl <= 0:
+        if "is_admin" in jwt_data and "is_active" in jwt_data:
+            return {"is_admin": jwt_data["is_admin"], "is_active": jwt_data["is_active"]}
+        return _load_flags(user_id)
+
+    flags = user_cache.get(user_id)
+    if flags is None:
+        flags = _load_flags(user_id)
+        if flags is not None:
+            user_cache.put(user_id, flags, ttl)
+    return flags
+
+
+def register_user_loader(jwt):
+    """Hook the lookups above into flask-jwt-extended's `current_user`."""
+
+    @jwt.user_lookup_loader
+    def load_current_user(jwt_header, jwt_data):
+        user_id = jwt_data[current_app.config["JWT_IDENTITY_CLAIM"]]
+        flags = resolve_flags(user_id, jwt_data)
+        if flags is None or not flags["is_active"]:
+            return None
+        return CurrentUser(user_id, **flags)
+
+    @jwt.user_lookup_error_loader
+    def user_lookup_error(jwt_header, jwt_data):
+        return jsonify(
+            {"success": False, "data": None, "error": "User not found or inactive"}
+        ), 401
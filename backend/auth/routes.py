@@ -8,8 +8,10 @@ from flask import Blueprint, request
 from flask_jwt_extended import create_access_token
 from core import db
 from users.models import User, Wallet
+from .identity import token_claims
 from utils import make_response
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 
 auth_bp = Blueprint("auth", __name__, url_prefix="/auth")
 
@@ -72,7 +74,11 @@ def login():
             error="Missing required fields: email, password", status=400
         )
 
-    user = User.query.filter_by(email=data["email"]).first()
+    user = (
+        User.query.options(joinedload(User.wallet))
+        .filter_by(email=data["email"])
+        .first()
+    )
 
     if not user or not user.check_password(data["password"]):
         return make_response(error="Invalid email or password", status=401)
@@ -80,7 +86,12 @@ def login():
     if not user.is_active:
         return make_response(error="Account is inactive", status=403)
 
-    access_token = create_access_token(identity=user.id)
+    if user.rehash_password_if_needed(data["password"]):
+        db.session.commit()
+
+    access_token = create_access_token(
+        identity=user.id, additional_claims=token_claims(user)
+    )
 
     return make_response(
         data={
@@ -0,0 +1,61 @@
+"""
+Script Name : bcrypt_cost.py
+Description : Measure login (bcrypt verify) throughput at each work factor
+Author      : @tonybnya
+
+Usage: python benchmarks/bcrypt_cost.py [--costs 10 11 12 13] [--clients 16]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import hash_password, verify_password  # noqa: E402
+
+
+def bench(cost, clients, duration):
+    hashed = hash_password("correct horse battery", rounds=cost)
+
+    start = time.perf_counter()
+    verify_password("correct horse battery", hashed)
+    single = time.perf_counter() - start
+
+    # `clients` request threads hammer verify_password, which itself goes
+    # through the bounded bcrypt pool, like concurrent logins in one worker
+    deadline = time.perf_counter() + duration
+
+    def client():
+        count = 0
+        while time.perf_counter() < deadline:
+            verify_password("correct horse battery", hashed)
+            count += 1
+        return count
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        done = sum(pool.map(lambda _: client(), range(clients)))
+    elapsed = time.perf_counter() - start
+
+    return single * 1000, done / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--costs", type=int, nargs="+", default=[10, 11, 12, 13])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"cpus={os.cpu_count()} clients={args.clients}")
+    print(f"{'cost':>4}  {'verify ms':>10}  {'logins/s':>9}")
+    for cost in args.costs:
+        single_ms, throughput = bench(cost, args.clients, args.duration)
+        print(f"{cost:>4}  {single_ms:>10.1f}  {throughput:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
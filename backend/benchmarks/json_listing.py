@@ -0,0 +1,101 @@
+"""
+Script Name : json_listing.py
+Description : Measure the JSON serialization cost of large transaction listings
+Author      : @tonybnya
+
+Usage: python benchmarks/json_listing.py [--rows 1000 10000 100000] [--repeat 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.serialization import JSONProvider  # noqa: E402
+
+
+def listing(rows):
+    """A /transactions/all-like payload, amounts left as Decimal."""
+    start = datetime(2024, 1, 1)
+    return {
+        "success": True,
+        "data": [
+            {
+                "id": str(uuid.uuid4()),
+                "wallet_id": str(uuid.uuid4()),
+                "amount": Decimal(f"{(i * 7919) % 1000000}.{i % 100:02d}"),
+                "type": "DEPOSIT" if i % 2 else "WITHDRAWAL",
+                "created_at": (start + timedelta(seconds=i)).isoformat(),
+            }
+            for i in range(rows)
+        ],
+        "count": rows,
+        "error": None,
+    }
+
+
+def as_floats(payload):
+    # what the routes used to hand to jsonify
+    return {
+        **payload,
+        "data": [{**tx, "amount": float(tx["amount"])} for tx in payload["data"]],
+    }
+
+
+def bench(app, payload, repeat):
+    best = float("inf")
+    with app.app_context():
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = app.json.response(payload)
+            best = min(best, time.perf_counter() - start)
+    return best * 1000, len(response.get_data())
+
+
+def make_app(provider, **config):
+    app = Flask(__name__)
+    app.config.update(config)
+    app.json = provider(app)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    variants = [
+        ("stdlib, float()", make_app(DefaultJSONProvider), True),
+        (
+            "stdlib, strings",
+            make_app(JSONProvider, JSON_USE_ORJSON=False, JSON_AMOUNTS_AS_STRINGS=True),
+            False,
+        ),
+        ("orjson, numbers", make_app(JSONProvider), False),
+        (
+            "orjson, strings",
+            make_app(JSONProvider, JSON_AMOUNTS_AS_STRINGS=True),
+            False,
+        ),
+    ]
+
+    print(f"{'rows':>7}  {'encoder':<16}  {'ms':>9}  {'bytes':>10}")
+    for rows in args.rows:
+        payload = listing(rows)
+        floats = as_floats(payload)
+        for name, app, needs_floats in variants:
+            ms, size = bench(app, floats if needs_floats else payload, args.repeat)
+            print(f"{rows:>7}  {name:<16}  {ms:>9.1f}  {size:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,475 @@
+"""
+Script Name : load_test.py
+Description : Drive concurrent money traffic at a running server and check the books
+Author      : @tonybnya
+
+Usage: python benchmarks/load_test.py [--base-url http://127.0.0.1:5000]
+                                      [--users 50] [--clients 16] [--duration 30]
+                                      [--mix deposit=25,withdraw=15,transfer=35,history=20,search=5]
+                                      [--output results.json] [--compare previous.json]
+
+Start the server first (flask run, or gunicorn -c gunicorn.conf.py run:app),
+preferably on a throwaway database: every run registers --users new users,
+funds them with --initial-balance, then has --clients threads pick an
+operation from --mix and run it as one of those users until --duration
+elapses. Transfers stay between the seeded users.
+
+Latency percentiles and throughput are reported per operation and written
+as JSON, next to the commit being measured, for --compare to diff against
+a later run. The run fails (exit status 1) when the money held by the
+seeded wallets isn't the funding plus the deposits minus the withdrawals
+the server acknowledged, or when a wallet went negative.
+
+Money moves carry an Idempotency-Key, so a request that timed out is
+replayed until the server tells whether it was applied; only then can the
+books be checked to the cent.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from decimal import Decimal
+from urllib.parse import urlencode, urlsplit
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+OPERATIONS = ("deposit", "withdraw", "transfer", "history", "search")
+DEFAULT_MIX = "deposit=25,withdraw=15,transfer=35,history=20,search=5"
+PASSWORD = "load-test-password"
+CENTS = Decimal("0.01")
+REPLAYS = 5
+
+
+class Client:
+    """One keep-alive connection per thread, reopened after a failure."""
+
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        self.connection_class = (
+            http.client.HTTPSConnection
+            if parts.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = self.local.connection = self.connection_class(
+                self.netloc, timeout=self.timeout
+            )
+        return connection
+
+    def request(self, method, path, token=None, body=None, headers=None):
+        """(status, parsed body, seconds); status is None when no answer came."""
+        headers = dict(headers or {})
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        if body is not None:
+            headers["Content-Type"] = "application/json"
+            body = json.dumps(body)
+
+        start = time.perf_counter()
+        try:
+            connection = self._connection()
+            connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = connection.getresponse()
+            raw = response.read()
+        except (OSError, http.client.HTTPException):
+            self.local.connection.close()
+            self.local.connection = None
+            return None, None, time.perf_counter() - start
+        elapsed = time.perf_counter() - start
+
+        try:
+            # exact amounts whether the server sends numbers or strings
+            payload = json.loads(raw, parse_float=Decimal)
+        except ValueError:
+            payload = None
+        return response.status, payload, elapsed
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(
+                f"unknown operation {name!r}, expected one of {', '.join(OPERATIONS)}"
+            )
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"bad weight for {name}: {weight!r}")
+    if sum(mix.values()) <= 0:
+        raise argparse.ArgumentTypeError("the mix needs at least one positive weight")
+    return mix
+
+
+def random_amount(low, high):
+    return (Decimal(random.randint(low * 100, high * 100)) * CENTS).quantize(CENTS)
+
+
+def seed(client, users, initial_balance, clients):
+    """Register, log in and fund `users` users; returns [{id, token, username}]."""
+    run = uuid.uuid4().hex[:8]
+
+    def make_user(i):
+        username = f"load{run}u{i}"
+        email = f"{username}@paylite.local"
+        status, payload, _ = client.request(
+            "POST",
+            "/auth/register",
+            body={
+                "firstname": "Load",
+                "lastname": f"Test{i}",
+                "username": username,
+                "email": email,
+                "password": PASSWORD,
+            },
+        )
+        if status != 201:
+            raise RuntimeError(f"register {username}: {status} {payload}")
+
+        status, payload, _ = client.request(
+            "POST", "/auth/login", body={"email": email, "password": PASSWORD}
+        )
+        if status != 200:
+            raise RuntimeError(f"login {username}: {status} {payload}")
+        user = {
+            "id": payload["data"]["user"]["id"],
+            "token": payload["data"]["access_token"],
+            "username": username,
+        }
+
+        if initial_balance > 0:
+            status, _ = money_move(
+                client,
+                user,
+                "/transactions/deposit",
+                {"amount": str(initial_balance)},
+            )
+            if status != 201:
+                raise RuntimeError(f"funding {username}: {status}")
+        return user
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        return list(pool.map(make_user, range(users)))
+
+
+def money_move(client, user, path, body, record=None):
+    """POST a money move, replaying it under the same key until it settles.
+
+    Returns (status, payload) of the definitive answer, status None if the
+    server never gave one.
+    """
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+    for attempt in range(REPLAYS):
+        status, payload, elapsed = client.request(
+            "POST", path, token=user["token"], body=body, headers=headers
+        )
+        if record is not None and attempt == 0:
+            record(status, elapsed)
+        if status is not None and status < 500:
+            return status, payload
+        time.sleep(0.1 * (attempt + 1))
+    return None, None
+
+
+class Stats:
+    """Latencies and outcomes per operation, shared by the client threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {name: [] for name in OPERATIONS}
+        self.statuses = {name: {} for name in OPERATIONS}
+        self.deposited = Decimal("0")
+        self.withdrawn = Decimal("0")
+        self.unresolved = 0
+        self.negative_balances = []
+
+    def recorder(self, name):
+        def record(status, elapsed):
+            with self.lock:
+                self.latencies[name].append(elapsed)
+                key = str(status) if status is not None else "no_response"
+                self.statuses[name][key] = self.statuses[name].get(key, 0) + 1
+
+        return record
+
+    def settle(self, name, status, payload, amount):
+        with self.lock:
+            if status is None:
+                self.unresolved += 1
+                return
+            if status >= 300:
+                return
+            data = payload["data"]
+            if name == "deposit":
+                self.deposited += amount
+                balances = [data["new_balance"]]
+            elif name == "withdraw":
+                self.withdrawn += amount
+                balances = [data["new_balance"]]
+            else:
+                balances = [data["from_wallet_balance"], data["to_wallet_balance"]]
+            for balance in balances:
+                if Decimal(str(balance)) < 0:
+                    self.negative_balances.append(str(balance))
+
+
+def run_operation(client, stats, users, name):
+    user = random.choice(users)
+    record = stats.recorder(name)
+
+    if name == "history":
+        status, _, elapsed = client.request(
+            "GET", "/transactions/me?per_page=20", token=user["token"]
+        )
+        record(status, elapsed)
+        return
+    if name == "search":
+        term = random.choice(users)["username"][:-1]
+        status, _, elapsed = client.request(
+            "GET", "/users/search?" + urlencode({"q": term}), token=user["token"]
+        )
+        record(status, elapsed)
+        return
+
+    if name == "deposit":
+        amount = random_amount(1, 100)
+        path, body = "/transactions/deposit", {"amount": str(amount)}
+    elif name == "withdraw":
+        amount = random_amount(1, 50)
+        path, body = "/transactions/withdraw", {"amount": str(amount)}
+    else:
+        amount = random_amount(1, 50)
+        to_user = random.choice([u for u in users if u is not user])
+        path = "/transactions/transfer"
+        body = {"to_user_id": to_user["id"], "amount": str(amount)}
+
+    status, payload = money_move(client, user, path, body, record)
+    stats.settle(name, status, payload, amount)
+
+
+def drive(client, users, mix, clients, duration):
+    stats = Stats()
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        while time.perf_counter() < deadline:
+            (name,) = random.choices(names, weights)
+            run_operation(client, stats, users, name)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        for future in [pool.submit(worker) for _ in range(clients)]:
+            future.result()
+    return stats, time.perf_counter() - start
+
+
+def balances(client, users, clients):
+    def balance(user):
+        status, payload, _ = client.request("GET", "/wallets/me", token=user["token"])
+        if status != 200:
+            raise RuntimeError(f"wallet of {user['username']}: {status} {payload}")
+        return Decimal(str(payload["data"]["balance"]))
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        return list(pool.map(balance, users))
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(stats, elapsed):
+    endpoints = {}
+    for name in OPERATIONS:
+        ordered = sorted(stats.latencies[name])
+        if not ordered:
+            continue
+        endpoints[name] = {
+            "requests": len(ordered),
+            "throughput": round(len(ordered) / elapsed, 2),
+            **{
+                f"p{p}_ms": round(percentile(ordered, p / 100) * 1000, 3)
+                for p in (50, 95, 99)
+            },
+            "max_ms": round(ordered[-1] * 1000, 3),
+            "statuses": stats.statuses[name],
+        }
+    total = sum(len(v) for v in stats.latencies.values())
+    endpoints["total"] = {
+        "requests": total,
+        "throughput": round(total / elapsed, 2),
+    }
+    return endpoints
+
+
+def check_invariants(stats, funded, final):
+    expected = funded + stats.deposited - stats.withdrawn
+    held = sum(final, Decimal("0"))
+    negative = [str(balance) for balance in final if balance < 0]
+    return {
+        "money_conserved": held == expected and stats.unresolved == 0,
+        "expected_total": str(expected),
+        "actual_total": str(held),
+        "difference": str(held - expected),
+        "unresolved_requests": stats.unresolved,
+        "no_negative_balance": not negative and not stats.negative_balances,
+        "negative_final_balances": negative,
+        "negative_balances_seen": stats.negative_balances,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCHMARKS_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(result, previous=None):
+    print(
+        f"{'operation':<10}  {'req/s':>9}  {'p50 ms':>9}  {'p95 ms':>9}  "
+        f"{'p99 ms':>9}  {'requests':>8}"
+    )
+    for name, row in result["endpoints"].items():
+        if name == "total":
+            continue
+        print(
+            f"{name:<10}  {row['throughput']:>9.1f}  {row['p50_ms']:>9.2f}  "
+            f"{row['p95_ms']:>9.2f}  {row['p99_ms']:>9.2f}  {row['requests']:>8}"
+        )
+        before = (previous or {}).get("endpoints", {}).get(name)
+        if before:
+            print(
+                f"{'  vs ' + str(previous.get('commit')):<10}  "
+                + "  ".join(
+                    f"{_change(before[key], row[key]):>9}"
+                    for key in ("throughput", "p50_ms", "p95_ms", "p99_ms")
+                )
+            )
+    total = result["endpoints"]["total"]
+    print(f"total       {total['throughput']:>9.1f}  req/s over {total['requests']} requests")
+
+    checks = result["invariants"]
+    print(
+        f"money conserved: {checks['money_conserved']} "
+        f"(expected {checks['expected_total']}, held {checks['actual_total']}, "
+        f"{checks['unresolved_requests']} unresolved)"
+    )
+    print(f"no negative balance: {checks['no_negative_balance']}")
+
+
+def _change(before, after):
+    if not before:
+        return "-"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--initial-balance", type=Decimal, default=Decimal("1000.00"))
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=0.0,
+        help="seconds to wait before the final balance check (replica lag)",
+    )
+    parser.add_argument("--output", help="default: benchmarks/results/<time>-<commit>.json")
+    parser.add_argument("--compare", help="a previous result file to diff against")
+    args = parser.parse_args()
+
+    if args.users < 2 and args.mix.get("transfer"):
+        parser.error("transfers need at least 2 users")
+
+    client = Client(args.base_url, args.timeout)
+    status, _, _ = client.request("GET", "/health")
+    if status != 200:
+        sys.exit(f"{args.base_url} is not answering /health, start the server first")
+
+    print(f"seeding {args.users} users on {args.base_url}...")
+    users = seed(client, args.users, args.initial_balance, args.clients)
+    funded = sum(balances(client, users, args.clients), Decimal("0"))
+
+    print(f"running {args.clients} clients for {args.duration:g}s...")
+    started_at = datetime.now(timezone.utc)
+    stats, elapsed = drive(client, users, args.mix, args.clients, args.duration)
+
+    time.sleep(args.settle)
+    final = balances(client, users, args.clients)
+
+    commit = git_commit()
+    result = {
+        "commit": commit,
+        "started_at": started_at.isoformat(),
+        "elapsed_seconds": round(elapsed, 3),
+        "config": {
+            "base_url": args.base_url,
+            "users": args.users,
+            "clients": args.clients,
+            "duration": args.duration,
+            "mix": args.mix,
+            "initial_balance": str(args.initial_balance),
+        },
+        "endpoints": summarize(stats, elapsed),
+        "invariants": check_invariants(stats, funded, final),
+    }
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_report(result, previous)
+
+    output = args.output or os.path.join(
+        BENCHMARKS_DIR,
+        "results",
+        f"{started_at:%Y%m%dT%H%M%S}-{commit or 'unknown'}.json",
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"results written to {output}")
+
+    checks = result["invariants"]
+    if not (checks["money_conserved"] and checks["no_negative_balance"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Script Name : lock_modes.py
+Description : Compare pessimistic and optimistic wallet locking under contention
+Author      : @tonybnya
+
+Usage: python benchmarks/lock_modes.py [--database-url postgresql://... --drop-tables]
+                                       [--hot 2 10 100] [--clients 16]
+
+Each client thread transfers 1.00 between two random wallets picked among
+the `hot` ones, so fewer hot wallets means more writers racing for the
+same rows. SQLite serializes every writer on the database lock whatever the
+mode, its numbers say nothing about the modes; run against Postgres to see
+the row-level difference.
+
+Every round drops and recreates all the tables: without --database-url the
+run uses a temporary SQLite file, a --database-url must point at a
+throwaway database and be confirmed with --drop-tables.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from core import create_app, db  # noqa: E402
+from transactions.ledger import (  # noqa: E402
+    LOCK_MODES,
+    ConcurrencyConflict,
+    InsufficientBalance,
+    credit,
+    debit,
+    lock_wallets,
+    record_transactions,
+    retry_stats,
+    run_with_retry,
+)
+from users.models import User, Wallet  # noqa: E402
+
+AMOUNT = Decimal("1.00")
+
+
+def setup(app, wallets):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        users = [
+            User(
+                firstname="Bench",
+                lastname=str(i),
+                username=f"bench{i}",
+                email=f"bench{i}@paylite.local",
+                password_hash="-",
+                wallet=Wallet(balance=Decimal("1000000.00")),
+            )
+            for i in range(wallets)
+        ]
+        db.session.add_all(users)
+        db.session.commit()
+        return [user.id for user in users]
+
+
+def transfer(from_user_id, to_user_id):
+    def apply_transfer():
+        lock_wallets(from_user_id, to_user_id)
+        from_wallet_id, _ = debit(from_user_id, AMOUNT)
+        to_wallet_id, _ = credit(to_user_id, AMOUNT)
+        record_transactions(
+            [
+                {
+                    "wallet_id": from_wallet_id,
+                    "amount": AMOUNT,
+                    "transaction_type": "TRANSFER_OUT",
+                },
+                {
+                    "wallet_id": to_wallet_id,
+                    "amount": AMOUNT,
+                    "transaction_type": "TRANSFER_IN",
+                },
+            ]
+        )
+
+    run_with_retry(apply_transfer)
+
+
+def bench(app, user_ids, clients, duration):
+    retry_stats.update(retries=0, exhausted=0)
+    deadline = time.perf_counter() + duration
+
+    def client():
+        done = failed = 0
+        with app.app_context():
+            while time.perf_counter() < deadline:
+                from_user_id, to_user_id = random.sample(user_ids, 2)
+                try:
+                    transfer(from_user_id, to_user_id)
+                    done += 1
+                except (ConcurrencyConflict, InsufficientBalance):
+                    failed += 1
+        return done, failed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(lambda _: client(), range(clients)))
+    elapsed = time.perf_counter() - start
+
+    done = sum(r[0] for r in results)
+    failed = sum(r[1] for r in results)
+    return done / elapsed, retry_stats["retries"], failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", help="a throwaway database, it is wiped")
+    parser.add_argument(
+        "--drop-tables",
+        action="store_true",
+        help="confirm that every table of --database-url may be dropped",
+    )
+    parser.add_argument("--hot", type=int, nargs="+", default=[2, 10, 100])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+    if args.database_url and not args.drop_tables:
+        parser.error("--database-url is wiped on every round, pass --drop-tables")
+
+    database_url = args.database_url or "sqlite:///" + os.path.join(
+        tempfile.mkdtemp(), "lock_modes.db"
+    )
+    config.TestConfig.SQLALCHEMY_DATABASE_URI = database_url
+    app = create_app("test")
+    app.logger.setLevel("ERROR")  # one warning per retry otherwise
+
+    print(f"db={database_url.split(':')[0]} clients={args.clients}")
+    if database_url.startswith("sqlite"):
+        print("SQLite serializes all writers, both modes queue on the same lock")
+    print(f"{'hot':>5}  {'mode':<11}  {'transfers/s':>11}  {'retries':>8}  {'aborted':>8}")
+    for hot in args.hot:
+        for mode in LOCK_MODES:
+            app.config["LEDGER_LOCK_MODE"] = mode
+            user_ids = setup(app, hot)
+            throughput, retries, aborted = bench(
+                app, user_ids, args.clients, args.duration
+            )
+            print(
+                f"{hot:>5}  {mode:<11}  {throughput:>11.1f}  {retries:>8}  {aborted:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,53 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 load_dotenv(os.path.join(basedir, ".env"))
 
 
+# gunicorn worker models: processes only, threads or greenlets per process
+WORKER_CLASSES = ("sync", "gthread", "gevent")
+
+
+def server_concurrency():
+    """(worker_class, workers, requests served at once per worker).
+
+    Shared by gunicorn.conf.py and the DB pool sizing below, so the pools
+    always match the server actually running. Raises ValueError for an
+    unknown GUNICORN_WORKER_CLASS.
+    """
+    cpus = os.cpu_count() or 1
+    worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+    if worker_class not in WORKER_CLASSES:
+        raise ValueError(f"GUNICORN_WORKER_CLASS must be one of {WORKER_CLASSES}")
+
+    if worker_class == "sync":
+        workers, threads = cpus * 2 + 1, 1
+    elif worker_class == "gthread":
+        workers, threads = cpus + 1, int(os.environ.get("GUNICORN_THREADS", 4))
+    else:
+        connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 100))
+        workers, threads = cpus, connections
+    workers = int(os.environ.get("WEB_CONCURRENCY", workers))
+    return worker_class, workers, threads
+
+
+def pool_options():
+    """SQLAlchemy pool sized so that all workers fit in DB_MAX_CONNECTIONS.
+
+    Each worker keeps one connection per request thread and may open the
+    rest of its share of the budget as overflow under bursts. Called by
+    create_app for the prod config, not at import, so a bad server setting
+    only breaks the app that runs on it.
+    """
+    _, workers, threads = server_concurrency()
+    share = max(1, int(os.environ.get("DB_MAX_CONNECTIONS", 100)) // workers)
+    pool_size = min(threads, share)
+    return {
+        "pool_size": pool_size,
+        "max_overflow": share - pool_size,
+        "pool_timeout": int(os.environ.get("DB_POOL_TIMEOUT", 10)),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": True,
+    }
+
+
 class Config:
     """Base config."""
 
@@ -21,6 +68,67 @@ class Config:
     TEMPLATES_FOLDER = "templates"
     JWT_SECRET_KEY = os.environ.get("SECRET_KEY")
     JWT_ACCESS_TOKEN_EXPIRES = int(os.environ.get("JWT_ACCESS_TOKEN_EXPIRES", 3600))
+    # the is_admin/is_active flags are re-read from the DB at most every N
+    # seconds per process; 0 trusts the token claims until the token expires
+    AUTH_USER_CACHE_TTL = int(os.environ.get("AUTH_USER_CACHE_TTL", 30))
+    # bcrypt work factor, existing hashes are upgraded on the next login;
+    # see benchmarks/bcrypt_cost.py to pick one
+    BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+    # hashes computed at once per process, the rest queue
+    BCRYPT_MAX_WORKERS = int(os.environ.get("BCRYPT_MAX_WORKERS", 4))
+    # replays of money movements that lost a lock race (deadlock/serialization)
+    LEDGER_MAX_RETRIES = int(os.environ.get("LEDGER_MAX_RETRIES", 5))
+    LEDGER_RETRY_BASE_DELAY = float(os.environ.get("LEDGER_RETRY_BASE_DELAY", 0.02))
+    # "pessimistic" (row locks) or "optimistic" (version checks, replay on
+    # conflict); see benchmarks/lock_modes.py
+    LEDGER_LOCK_MODE = os.environ.get("LEDGER_LOCK_MODE", "pessimistic")
+    BATCH_TRANSFER_MAX_ITEMS = int(os.environ.get("BATCH_TRANSFER_MAX_ITEMS", 1000))
+    # stored responses of Idempotency-Key requests (seconds / per-process entries)
+    IDEMPOTENCY_TTL = int(os.environ.get("IDEMPOTENCY_TTL", 86400))
+    IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", 4096))
+    # seconds after which a key still without response is taken over by a
+    # retry; keep it above the worker timeout (GUNICORN_TIMEOUT)
+    IDEMPOTENCY_IN_FLIGHT_TIMEOUT = int(
+        os.environ.get("IDEMPOTENCY_IN_FLIGHT_TIMEOUT", 300)
+    )
+    # POST /users/import limits: rows per request, rows per INSERT batch,
+    # processes hashing passwords (0 = one per CPU); every row costs a bcrypt
+    # hash, keep a request well within GUNICORN_TIMEOUT and use the
+    # import-users command for larger files
+    USER_IMPORT_MAX_ROWS = int(os.environ.get("USER_IMPORT_MAX_ROWS", 500))
+    USER_IMPORT_BATCH_SIZE = int(os.environ.get("USER_IMPORT_BATCH_SIZE", 500))
+    USER_IMPORT_HASH_WORKERS = int(os.environ.get("USER_IMPORT_HASH_WORKERS", 0))
+    # JSON responses: orjson encoder (off: stdlib, amounts always strings),
+    # amounts as "12.50" strings instead of numbers for clients that parse
+    # numbers as doubles
+    JSON_USE_ORJSON = os.environ.get("JSON_USE_ORJSON", "true").lower() == "true"
+    JSON_AMOUNTS_AS_STRINGS = (
+        os.environ.get("JSON_AMOUNTS_AS_STRINGS", "false").lower() == "true"
+    )
+    # read-only endpoints read from this replica when set; users who just
+    # wrote keep reading from the primary for REPLICA_STICKY_SECONDS, through
+    # a signed X-Read-Primary header the client echoes and any worker checks
+    SQLALCHEMY_BINDS = (
+        {"replica": os.environ["REPLICA_DATABASE_URL"]}
+        if os.environ.get("REPLICA_DATABASE_URL")
+        else {}
+    )
+    REPLICA_STICKY_SECONDS = int(os.environ.get("REPLICA_STICKY_SECONDS", 5))
+    # /metrics: directory where each worker writes its snapshot so the
+    # scrape sums all of them (unset: this process only); optional bearer
+    # token required to scrape
+    METRICS_DIR = os.environ.get("METRICS_DIR")
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+    # request profiler: admins send X-Profile: 1 (or ?profile=1), and 1 in
+    # PROFILE_SAMPLE_RATE requests is profiled anyway (0 = never)
+    PROFILE_DIR = os.environ.get(
+        "PROFILE_DIR", os.path.join(basedir, "instance", "profiles")
+    )
+    PROFILE_SAMPLE_RATE = int(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+    PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", 0.005))
+    PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", 200))
+    # rows fetched per server-side cursor round trip by the streaming exports
+    EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", 1000))
 
 
 class DevConfig(Config):
@@ -33,6 +141,7 @@ class TestConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = "sqlite:///test.db"
     WTF_CSRF_ENABLED = False  # easier for from testing
+    BCRYPT_ROUNDS = 4  # minimum cost, keeps tests fast
 
 
 class ProdConfig(Config):
@@ -40,6 +149,7 @@ class ProdConfig(Config):
     DEBUG = False
     # use environment variables for sensitive prod data
     SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL")
+    # SQLALCHEMY_ENGINE_OPTIONS: pool_options(), filled in by create_app
 
 
 config_dict = {"dev": DevConfig, "prod": ProdConfig, "test": TestConfig}
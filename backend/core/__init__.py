@@ -8,10 +8,14 @@ from flask import Flask, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
-from config import config_dict
+from config import config_dict, pool_options
+from .metrics import register_metrics
+from .profiler import register_profiler
+from .replica import STICKY_HEADER, RoutingSession, register_replica_routing
+from .serialization import JSONProvider
 import os
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 jwt = JWTManager()
 
 
@@ -23,6 +27,10 @@ def create_app(config_name=None):
 
     # load configuration
     app.config.from_object(config_dict[config_name])
+    if config_name == "prod" and "SQLALCHEMY_ENGINE_OPTIONS" not in app.config:
+        # sized after the gunicorn settings, which only prod has to be valid
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = pool_options()
+    app.json = JSONProvider(app)
 
     # bind extensions to the app instance
     db.init_app(app)
@@ -33,6 +41,8 @@ def create_app(config_name=None):
         app,
         origins=["http://localhost:5173", "http://127.0.0.1:5173"],
         supports_credentials=True,
+        # read by the frontend and echoed back, see core.replica
+        expose_headers=[STICKY_HEADER],
     )
 
     # register blueprints (the routes)
@@ -48,6 +58,38 @@ def create_app(config_name=None):
     app.register_blueprint(wallets_bp)
     app.register_blueprint(tx_bp)
 
+    # resolve `current_user` from the token claims
+    from auth.identity import register_user_loader
+
+    register_user_loader(jwt)
+
+    # keep users who just wrote off the replica
+    register_replica_routing(app)
+
+    # request latency and SQL counters, served on /metrics
+    register_metrics(app, db)
+
+    # on-demand profiles, listed on /profiles
+    register_profiler(app)
+
+    # register CLI commands
+    from transactions.commands import (
+        create_indexes,
+        purge_idempotency_keys,
+        rebuild_daily_stats,
+        reconcile,
+    )
+    from users.commands import build_search_index, import_users, migrate_ids, seed
+
+    app.cli.add_command(create_indexes)
+    app.cli.add_command(purge_idempotency_keys)
+    app.cli.add_command(rebuild_daily_stats)
+    app.cli.add_command(reconcile)
+    app.cli.add_command(build_search_index)
+    app.cli.add_command(import_users)
+    app.cli.add_command(seed)
+    app.cli.add_command(migrate_ids)
+
     # global error handler for 404
     @app.errorhandler(404)
     def not_found_error(error):
@@ -0,0 +1,397 @@
+"""
+Script Name : metrics.py
+Description : Request, database and bcrypt metrics in the Prometheus text format
+Author      : @tonybnya
+"""
+
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+
+# counters of the workers that exited, folded together by merge_worker
+AGGREGATE_FILE = "metrics-aggregate.json"
+
+# name: (type, help, buckets)
+METRICS = {
+    "paylite_http_requests_total": (
+        "counter",
+        "HTTP requests served, per endpoint, method and status.",
+        None,
+    ),
+    "paylite_http_request_duration_seconds": (
+        "histogram",
+        "Time to build the response, per endpoint.",
+        LATENCY_BUCKETS,
+    ),
+    "paylite_db_queries_per_request": (
+        "histogram",
+        "SQL statements executed per request, per endpoint.",
+        QUERY_BUCKETS,
+    ),
+    "paylite_db_time_per_request_seconds": (
+        "histogram",
+        "Time spent executing SQL per request, per endpoint.",
+        LATENCY_BUCKETS,
+    ),
+    "paylite_db_pool_checkout_seconds": (
+        "histogram",
+        "Time waited for a pooled connection, connecting included.",
+        WAIT_BUCKETS,
+    ),
+    "paylite_bcrypt_seconds": (
+        "histogram",
+        "bcrypt hash/verify time, queueing for the bcrypt pool included.",
+        LATENCY_BUCKETS,
+    ),
+    "paylite_ledger_retries_total": (
+        "counter",
+        "Money movements replayed after losing a race.",
+        None,
+    ),
+    "paylite_ledger_retries_exhausted_total": (
+        "counter",
+        "Money movements that ran out of retries.",
+        None,
+    ),
+}
+
+
+class Registry:
+    """Per-process counters and histograms, keyed by (name, labels)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        # a worker recycled under the same pid must not overwrite the file
+        # of its predecessor, or the aggregated counters would go backwards
+        self.process_id = f"{self.pid}-{uuid.uuid4().hex[:8]}"
+        self.counters = {}
+        self.histograms = {}
+        self.changes = 0
+        self.flushed_changes = -1
+
+    def _check_fork(self):
+        # the master's values were copied into every worker at fork
+        if os.getpid() != self.pid:
+            self._reset()
+
+    def inc(self, name, labels=(), value=1):
+        with self._lock:
+            self._check_fork()
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+            self.changes += 1
+
+    def observe(self, name, value, labels=()):
+        buckets = METRICS[name][2]
+        with self._lock:
+            self._check_fork()
+            key = (name, labels)
+            series = self.histograms.get(key)
+            if series is None:
+                # one count per bucket (not cumulative), then sum and count
+                series = self.histograms[key] = [0] * len(buckets) + [0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+            self.changes += 1
+
+    def set(self, name, value, labels=()):
+        with self._lock:
+            self._check_fork()
+            self.counters[(name, labels)] = value
+
+    def snapshot(self):
+        with self._lock:
+            self._check_fork()
+            return {
+                "counters": [[n, list(l), v] for (n, l), v in self.counters.items()],
+                "histograms": [
+                    [n, list(l), list(v)] for (n, l), v in self.histograms.items()
+                ],
+            }
+
+
+registry = Registry()
+
+
+def _sync_ledger_stats():
+    from transactions.ledger import retry_stats
+
+    registry.set("paylite_ledger_retries_total", retry_stats["retries"])
+    registry.set("paylite_ledger_retries_exhausted_total", retry_stats["exhausted"])
+
+
+def flush(directory, force=False):
+    """Write this process' snapshot for the other workers to aggregate."""
+    _sync_ledger_stats()
+    changes = registry.changes
+    if not force and changes == registry.flushed_changes:
+        return
+    path = os.path.join(directory, f"metrics-{registry.process_id}.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(tmp, path)
+    registry.flushed_changes = changes
+
+
+_flusher_lock = threading.Lock()
+_flusher_pid = None
+
+
+def _flush_loop(directory, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            flush(directory)
+        except OSError:
+            pass  # retried on the next tick
+
+
+def start_flusher(directory, interval=1.0):
+    """Flush this process' metrics every `interval` seconds, off the request path.
+
+    Started lazily by the first request of each worker, since threads
+    don't survive the fork of a preloading server.
+    """
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+        threading.Thread(
+            target=_flush_loop,
+            args=(directory, interval),
+            name="metrics-flush",
+            daemon=True,
+        ).start()
+
+
+@contextmanager
+def _locked(directory, operation):
+    # scrapes read the snapshots under a shared lock, merge_worker swaps a
+    # worker's file for the aggregate under an exclusive one, so a scrape
+    # never counts a worker twice or not at all
+    with open(os.path.join(directory, "metrics.lock"), "a") as lock:
+        fcntl.flock(lock, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _load(paths):
+    snapshots = []
+    for path in paths:
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # being replaced right now, next scrape gets it
+    return snapshots
+
+
+def _sum(snapshots):
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in snapshot["histograms"]:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            total = histograms.setdefault(key, [0] * len(values))
+            for i, value in enumerate(values):
+                total[i] += value
+    return counters, histograms
+
+
+def merge_worker(directory, pid):
+    """Fold the snapshot of the exited worker `pid` into the aggregate file.
+
+    Called by the server when a worker exits, so recycled workers leave
+    one file behind in total rather than one each.
+    """
+    with _locked(directory, fcntl.LOCK_EX):
+        paths = glob.glob(os.path.join(directory, f"metrics-{pid}-*.json"))
+        if not paths:
+            return
+        aggregate = os.path.join(directory, AGGREGATE_FILE)
+        counters, histograms = _sum(_load([aggregate, *paths]))
+        tmp = f"{aggregate}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(
+                {
+                    "counters": [[n, l, v] for (n, l), v in counters.items()],
+                    "histograms": [[n, l, v] for (n, l), v in histograms.items()],
+                },
+                f,
+            )
+        os.replace(tmp, aggregate)
+        for path in paths:
+            os.remove(path)
+
+
+def _collect(directory):
+    """Sum the snapshots of every process, past workers included."""
+    if directory:
+        flush(directory, force=True)
+        with _locked(directory, fcntl.LOCK_SH):
+            snapshots = _load(glob.glob(os.path.join(directory, "metrics-*.json")))
+    else:
+        _sync_ledger_stats()
+        snapshots = [registry.snapshot()]
+    return _sum(snapshots)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def render(directory=None):
+    """All metrics in the Prometheus text exposition format."""
+    counters, histograms = _collect(directory)
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for (series, labels), value in sorted(counters.items()):
+                if series == name:
+                    lines.append(f"{name}{_labels(labels)} {value}")
+            continue
+        for (series, labels), values in sorted(histograms.items()):
+            if series != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, values):
+                cumulative += count
+                le = labels + (("le", repr(float(bound))),)
+                lines.append(f"{name}_bucket{_labels(le)} {cumulative}")
+            le = labels + (("le", "+Inf"),)
+            lines.append(f"{name}_bucket{_labels(le)} {values[-1]}")
+            lines.append(f"{name}_sum{_labels(labels)} {values[-2]}")
+            lines.append(f"{name}_count{_labels(labels)} {values[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+    context.query_timed = True
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    context.query_timed = False
+    if has_request_context() and "db_queries" in g:
+        g.db_queries += 1
+        g.db_time += elapsed
+        # set by the request profiler only
+        sql_log = g.get("sql_log")
+        if sql_log is not None:
+            sql_log.append((statement, elapsed))
+
+
+def _handle_error(exception_context):
+    # a failed statement never reaches after_cursor_execute: drop its start
+    # time, or the connection's stack would grow with every error
+    context = exception_context.execution_context
+    if context is not None and getattr(context, "query_timed", False):
+        exception_context.connection.info["query_start"].pop()
+        context.query_timed = False
+
+
+def time_checkouts(engine):
+    """Record how long the engine's pool takes to hand out a connection."""
+    pool = engine.pool
+    connect = pool.connect
+
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            registry.observe(
+                "paylite_db_pool_checkout_seconds", time.perf_counter() - start
+            )
+
+    pool.connect = timed_connect
+
+
+def register_metrics(app, db):
+    """Hook the request and database instrumentation into `app`."""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            time_checkouts(engine)
+            # dispose() (e.g. after a fork) replaces the pool
+            event.listen(engine, "engine_disposed", time_checkouts)
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+        g.db_queries = 0
+        g.db_time = 0.0
+
+    @app.after_request
+    def record_request(response):
+        if "request_start" not in g:
+            return response
+        endpoint = request.endpoint or "unmatched"
+        elapsed = time.perf_counter() - g.request_start
+
+        registry.inc(
+            "paylite_http_requests_total",
+            (
+                ("endpoint", endpoint),
+                ("method", request.method),
+                ("status", response.status_code),
+            ),
+        )
+        labels = (("endpoint", endpoint),)
+        registry.observe("paylite_http_request_duration_seconds", elapsed, labels)
+        registry.observe("paylite_db_queries_per_request", g.db_queries, labels)
+        registry.observe("paylite_db_time_per_request_seconds", g.db_time, labels)
+
+        if app.config["METRICS_DIR"]:
+            start_flusher(app.config["METRICS_DIR"])
+        return response
+
+
+def metrics_response():
+    """The /metrics response, summed over every worker when METRICS_DIR is set."""
+    body = render(current_app.config["METRICS_DIR"])
+    return current_app.response_class(
+        body, content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,234 @@
+"""
+Script Name : profiler.py
+Description : On-demand sampling profiler for single requests
+Author      : @tonybnya
+"""
+
+import glob
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from flask import g, request
+from flask_jwt_extended import current_user, verify_jwt_in_request
+
+HEADER = "X-Profile"
+
+
+def _gevent_patched():
+    # gevent is only imported by gunicorn.conf.py for the gevent workers
+    if "gevent" not in sys.modules:
+        return False
+    from gevent import monkey
+
+    return monkey.is_module_patched("threading")
+
+
+class StackSampler:
+    """Sample the stack of the calling thread every `interval` seconds.
+
+    The stacks are kept in the folded format (`outer;inner count` per
+    line) that flamegraph.pl, speedscope and inferno read as is.
+
+    Under gevent the caller is a greenlet and patched threads are greenlets
+    too, which would only run when the request yields. The sampler then
+    runs on a real OS thread and follows the request's greenlet: the frame
+    it is suspended in while it waits, its OS thread's current frame while
+    it runs.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self._greenlet = None
+        if _gevent_patched():
+            import greenlet
+            from gevent import monkey
+
+            self._greenlet = greenlet.getcurrent()
+            self._thread_id = monkey.get_original("_thread", "get_ident")()
+            self._sleep = monkey.get_original("time", "sleep")
+            self._start_thread = monkey.get_original("_thread", "start_new_thread")
+            self._finished = monkey.get_original("_thread", "allocate_lock")()
+            self._stopped = False
+        else:
+            self._thread_id = threading.get_ident()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run, name="profiler", daemon=True
+            )
+
+    def _frame(self):
+        frame = self._greenlet.gr_frame if self._greenlet is not None else None
+        return frame or sys._current_frames().get(self._thread_id)
+
+    def _sample(self):
+        frame = self._frame()
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            where = "/".join(code.co_filename.rsplit(os.sep, 2)[-2:])
+            stack.append(f"{code.co_name} ({where}:{code.co_firstlineno})")
+            frame = frame.f_back
+        if stack:
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _run_beside_gevent(self):
+        try:
+            while True:
+                self._sleep(self.interval)
+                if self._stopped:
+                    return
+                self._sample()
+        finally:
+            self._finished.release()
+
+    def start(self):
+        if self._greenlet is None:
+            self._thread.start()
+            return
+        self._finished.acquire()
+        self._start_thread(self._run_beside_gevent, ())
+
+    def stop(self):
+        if self._greenlet is None:
+            self._stop.set()
+            self._thread.join()
+            return
+        self._stopped = True
+        # blocks the worker for at most one interval
+        self._finished.acquire()
+        self._finished.release()
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+def _requested_by_admin():
+    if request.headers.get(HEADER) != "1" and request.args.get("profile") != "1":
+        return False
+    try:
+        verify_jwt_in_request(optional=True)
+    except Exception:
+        return False  # the endpoint itself reports the bad token
+    return current_user is not None and current_user.is_admin
+
+
+def _should_profile(app):
+    """(profile this request, tell the client about it)."""
+    if _requested_by_admin():
+        return True, True
+    rate = app.config["PROFILE_SAMPLE_RATE"]
+    return rate > 0 and random.random() < 1 / rate, False
+
+
+def _prune(directory, keep):
+    profiles = sorted(glob.glob(os.path.join(directory, "*.json")))
+    for path in profiles[: max(0, len(profiles) - keep)]:
+        for stale in (path, path[: -len(".json")] + ".folded"):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+
+def _save(app, sampler, duration, status):
+    directory = app.config["PROFILE_DIR"]
+    os.makedirs(directory, exist_ok=True)
+
+    now = datetime.now(timezone.utc)
+    endpoint = request.endpoint or "unmatched"
+    name = f"{now:%Y%m%dT%H%M%S%f}-{endpoint}-{uuid.uuid4().hex[:8]}"
+    meta = {
+        "name": name,
+        "created_at": now.isoformat(),
+        "method": request.method,
+        "path": request.full_path.rstrip("?"),
+        "endpoint": endpoint,
+        "status": status,
+        "duration_ms": round(duration * 1000, 3),
+        "samples": sum(sampler.stacks.values()),
+        "query_count": g.db_queries,
+        "db_time_ms": round(g.db_time * 1000, 3),
+        "queries": [
+            {"statement": statement, "duration_ms": round(elapsed * 1000, 3)}
+            for statement, elapsed in g.sql_log
+        ],
+    }
+
+    with open(os.path.join(directory, f"{name}.folded"), "w") as f:
+        f.write(sampler.folded())
+    # the .json lands last, listing only shows complete profiles
+    with open(os.path.join(directory, f"{name}.json"), "w") as f:
+        json.dump(meta, f)
+    _prune(directory, app.config["PROFILE_MAX_FILES"])
+    return name
+
+
+def list_profiles(directory):
+    """Metadata of the stored profiles, newest first, without the SQL."""
+    profiles = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json")), reverse=True):
+        try:
+            with open(path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        meta.pop("queries", None)
+        profiles.append(meta)
+    return profiles
+
+
+def register_profiler(app):
+    """Profile requests flagged by an admin, or 1 in PROFILE_SAMPLE_RATE.
+
+    Registered after the metrics hooks, whose per-request SQL counters it
+    reads. The response to an admin's profile request carries X-Profile-Id,
+    X-Query-Count and a Server-Timing header with the server and DB time;
+    sampled requests are only stored, their clients see nothing.
+    """
+
+    @app.before_request
+    def start_profiler():
+        profile, requested = _should_profile(app)
+        if not profile:
+            return
+        g.profile_requested = requested
+        g.sql_log = []
+        g.profiler = StackSampler(app.config["PROFILE_INTERVAL"])
+        g.profiler.start()
+
+    @app.after_request
+    def save_profile(response):
+        sampler = g.pop("profiler", None)
+        if sampler is None:
+            return response
+        sampler.stop()
+        duration = time.perf_counter() - g.request_start
+
+        name = _save(app, sampler, duration, response.status_code)
+        if not g.profile_requested:
+            return response
+        response.headers["X-Profile-Id"] = name
+        response.headers["X-Query-Count"] = str(g.db_queries)
+        response.headers["Server-Timing"] = (
+            f"app;dur={duration * 1000:.1f}, "
+            f'db;dur={g.db_time * 1000:.1f};desc="{g.db_queries} queries"'
+        )
+        return response
+
+    @app.teardown_request
+    def stop_profiler(error=None):
+        # after_request is skipped when the request failed unhandled
+        sampler = g.pop("profiler", None)
+        if sampler is not None:
+            sampler.stop()
@@ -0,0 +1,97 @@
+"""
+Script Name : replica.py
+Description : Route the reads of read-only endpoints to a replica database
+Author      : @tonybnya
+"""
+
+from functools import wraps
+from flask import current_app, g, has_app_context, request
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy.session import Session
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+REPLICA_BIND = "replica"
+# carries the user's read-your-writes window: sent on the responses to
+# writes and echoed by the client, so whichever worker serves the next read
+# keeps it on the primary
+STICKY_HEADER = "X-Read-Primary"
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.secret_key, salt="replica-sticky")
+
+
+def wrote_recently(user_id):
+    """True while the request carries a sticky token issued to `user_id`."""
+    token = request.headers.get(STICKY_HEADER)
+    if user_id is None or token is None:
+        return False
+    try:
+        writer = _serializer().loads(
+            token, max_age=current_app.config["REPLICA_STICKY_SECONDS"]
+        )
+    except BadSignature:  # forged, or expired
+        return False
+    return writer == user_id
+
+
+def _is_read(clause):
+    return getattr(clause, "is_select", False) and clause._for_update_arg is None
+
+
+class RoutingSession(Session):
+    """Session sending the plain SELECTs of replica-routed requests to the replica.
+
+    Anything else, flushes and SELECT ... FOR UPDATE included, goes to the
+    primary, and the first write pins the rest of the request there too.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            if self._flushing or getattr(clause, "is_dml", False):
+                g.db_wrote = True
+                g.db_read_replica = False
+            elif g.get("db_read_replica") and _is_read(clause):
+                return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _identity():
+    try:
+        return get_jwt_identity()
+    except RuntimeError:  # no token verified in this request
+        return None
+
+
+def read_replica(fn):
+    """Serve the endpoint's reads from the replica bind, when one is configured.
+
+    Goes under @jwt_required()/@admin_required. Users who moved money in
+    the last REPLICA_STICKY_SECONDS, as told by their sticky token, read
+    from the primary instead, so they see their own writes despite the
+    replication lag whichever worker serves them.
+    """
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if REPLICA_BIND in current_app.config["SQLALCHEMY_BINDS"]:
+            g.db_read_replica = not wrote_recently(_identity())
+        return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def register_replica_routing(app):
+    """Hand writers a sticky token, to keep their next reads on the primary.
+
+    A header rather than a cookie: the frontend calls the API cross-origin
+    without credentials, and echoes the latest token it was given.
+    """
+
+    @app.after_request
+    def remember_writer(response):
+        if g.get("db_wrote") and REPLICA_BIND in app.config["SQLALCHEMY_BINDS"]:
+            user_id = _identity()
+            if user_id is not None:
+                response.headers[STICKY_HEADER] = _serializer().dumps(user_id)
+        return response
@@ -4,8 +4,16 @@ Description : Definition of the core routes
 Author      : @tonybnya
 """
 
-from flask import Blueprint
+import hmac
+import json
+import os
+import re
+from flask import Blueprint, abort, current_app, request, send_from_directory
 from datetime import datetime
+from auth.decorators import admin_required
+from utils import make_response
+from .metrics import metrics_response
+from .profiler import list_profiles
 
 core_bp = Blueprint('core', __name__)
 
@@ -27,3 +35,41 @@ def health_check():
         "service": "PayLite API",
         "timestamp": datetime.now()
     }, 200
+
+
+@core_bp.route('/metrics', methods=['GET'])
+def metrics():
+    token = current_app.config["METRICS_TOKEN"]
+    if token and not hmac.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    ):
+        return {"success": False, "data": None, "error": "Unauthorized"}, 401
+    return metrics_response()
+
+
+@core_bp.route('/profiles', methods=['GET'])
+@admin_required
+def get_profiles():
+    """List the stored request profiles, newest first."""
+    profiles = list_profiles(current_app.config["PROFILE_DIR"])
+    return make_response(data=profiles, count=len(profiles))
+
+
+@core_bp.route('/profiles/<string:name>', methods=['GET'])
+@admin_required
+def get_profile(name):
+    """A profile with its SQL statements, or ?format=folded for the flamegraph."""
+    if not re.fullmatch(r"[\w.-]+", name):
+        abort(404)
+    directory = current_app.config["PROFILE_DIR"]
+
+    if request.args.get("format") == "folded":
+        return send_from_directory(
+            directory, f"{name}.folded", mimetype="text/plain", as_attachment=True
+        )
+
+    try:
+        with open(os.path.join(directory, f"{name}.json")) as f:
+            return make_response(data=json.load(f))
+    except FileNotFoundError:
+        abort(404)
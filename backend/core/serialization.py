@@ -0,0 +1,97 @@
+"""
+Script Name : serialization.py
+Description : JSON provider with exact Decimal amounts, backed by orjson
+Author      : @tonybnya
+"""
+
+import dataclasses
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from uuid import UUID
+import orjson
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask JSON provider for the API responses.
+
+    Decimal values (balances, amounts) are written as exact JSON numbers,
+    or as strings with JSON_AMOUNTS_AS_STRINGS for clients parsing numbers
+    into doubles. Dates and datetimes keep Flask's HTTP-date format (RFC
+822), routes wanting ISO 8601 call isoformat(); UUIDs are plain strings.
+    Encoding goes through orjson; the stdlib encoder, used with
+    JSON_USE_ORJSON off or for dumps() calls with stdlib options, can't
+    write exact numbers and always writes amounts as strings.
+    """
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.amounts_as_strings = app.config.get("JSON_AMOUNTS_AS_STRINGS", False)
+        self.fast = app.config.get("JSON_USE_ORJSON", True)
+
+    def _orjson_default(self, value):
+        if isinstance(value, Decimal):
+            if not value.is_finite():
+                raise TypeError(f"{value} is not valid JSON")
+            number = format(value, "f")
+            return number if self.amounts_as_strings else orjson.Fragment(number)
+        return self.default(value)
+
+    def default(self, value):
+        if isinstance(value, Decimal):
+            if not value.is_finite():
+                raise TypeError(f"{value} is not valid JSON")
+            return format(value, "f")
+        if isinstance(value, (date, datetime)):
+            return http_date(value)
+        if isinstance(value, time):
+            return value.isoformat()
+        if isinstance(value, UUID):
+            return str(value)
+        if dataclasses.is_dataclass(value) and not isinstance(value, type):
+            return dataclasses.asdict(value)
+        if hasattr(value, "__html__"):
+            return str(value.__html__())
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    def _options(self, sort_keys, indent=False):
+        # orjson writes datetimes as ISO 8601 itself, route them to default()
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        sort_keys = kwargs.pop("sort_keys", self.sort_keys)
+        if self.fast and not kwargs:
+            return orjson.dumps(
+                obj, default=self._orjson_default, option=self._options(sort_keys)
+            ).decode("utf-8")
+
+        kwargs.setdefault("default", self.default)
+        kwargs.setdefault("ensure_ascii", self.ensure_ascii)
+        return json.dumps(obj, sort_keys=sort_keys, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if self.fast and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+
+        if not self.fast:
+            dump_args = {"indent": 2} if indent else {"separators": (",", ":")}
+            body = f"{self.dumps(obj, **dump_args)}\n"
+        else:
+            body = orjson.dumps(
+                obj,
+                default=self._orjson_default,
+                option=self._options(self.sort_keys, indent) | orjson.OPT_APPEND_NEWLINE,
+            )
+        return self._app.response_class(body, mimetype=self.mimetype)
@@ -0,0 +1,101 @@
+"""
+Script Name : gunicorn.conf.py
+Description : Production server profile for gunicorn
+Author      : @tonybnya
+
+Usage: gunicorn -c gunicorn.conf.py run:app
+
+Environment:
+    GUNICORN_WORKER_CLASS        sync | gthread (default) | gevent
+    WEB_CONCURRENCY              worker processes (default from CPU count)
+    GUNICORN_THREADS             threads per gthread worker (default 4)
+    GUNICORN_WORKER_CONNECTIONS  greenlets per gevent worker (default 100)
+    GUNICORN_TIMEOUT             seconds before a silent worker is killed
+    PORT                         port to listen on (default 5000)
+    METRICS_DIR                  per-worker metric snapshots, summed by /metrics
+"""
+
+import glob
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# set before the app loads its config: every worker then shares its
+# metrics through this directory
+os.environ.setdefault(
+    "METRICS_DIR", os.path.join(tempfile.gettempdir(), "paylite-metrics")
+)
+
+from config import server_concurrency  # noqa: E402
+
+worker_class, workers, threads = server_concurrency()
+
+if worker_class == "gevent":
+    # before the app is preloaded, or its sockets and locks stay blocking;
+    # psycopg2 is made cooperative in post_fork
+    from gevent import monkey
+
+    monkey.patch_all()
+    worker_connections = threads
+    threads = 1
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# the app is imported once in the master and shared copy-on-write
+preload_app = True
+
+# bcrypt runs off the request thread and exports stream, so a request that
+# is silent this long is stuck
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+graceful_timeout = 30
+keepalive = 5
+
+# recycle workers now and then, staggered, to bound slow leaks
+max_requests = 10000
+max_requests_jitter = 1000
+
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    # counters restart from zero with the server, as Prometheus expects
+    directory = os.environ["METRICS_DIR"]
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "metrics-*.json")):
+        os.remove(path)
+
+
+def worker_exit(server, worker):
+    # keep the last requests of a recycled worker in the totals
+    from core.metrics import flush
+
+    flush(os.environ["METRICS_DIR"], force=True)
+
+
+def child_exit(server, worker):
+    # fold the exited worker's counters into one aggregate file, or every
+    # recycled worker would leave a snapshot behind for /metrics to read
+    from core.metrics import merge_worker
+
+    merge_worker(os.environ["METRICS_DIR"], worker.pid)
+
+
+def post_fork(server, worker):
+    # pooled connections opened by the master must not be shared across
+    # processes: drop them without closing, each worker opens its own
+    from core import db
+
+    if worker_class == "gevent":
+        # psycopg2 waits on the socket through gevent instead of blocking
+        # the hub, so other greenlets run during a query
+        from psycogreen.gevent import patch_psycopg
+
+        patch_psycopg()
+
+    app = server.app.wsgi()
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
@@ -0,0 +1,67 @@
+"""
+Script Name : conftest.py
+Description : Shared pytest fixtures, an app on a throwaway SQLite database
+Author      : @tonybnya
+"""
+
+import pytest
+from flask_jwt_extended import create_access_token
+from auth.identity import token_claims
+from config import TestConfig
+from core import create_app, db
+from users.models import User, Wallet
+
+
+@pytest.fixture
+def config_overrides():
+    """TestConfig attributes to override, for modules that need more setup."""
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch, config_overrides):
+    for key, value in config_overrides.items():
+        monkeypatch.setattr(TestConfig, key, value)
+    monkeypatch.setattr(
+        TestConfig, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{tmp_path / 'test.db'}"
+    )
+    monkeypatch.setattr(TestConfig, "SECRET_KEY", "test-secret-key-" + "x" * 32)
+    monkeypatch.setattr(TestConfig, "JWT_SECRET_KEY", "test-secret-key-" + "x" * 32)
+    app = create_app("test")
+    with app.app_context():
+        # the shared db keeps a metadata per bind key any app declared, only
+        # the default one is created here (replica tests copy its file)
+        db.create_all(bind_key=None)
+        yield app
+        db.session.remove()
+        db.drop_all(bind_key=None)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def add_users(count, is_admin=False):
+    """Insert `count` users with their wallets, return them."""
+    users = []
+    start = User.query.count()
+    for index in range(start, start + count):
+        user = User(
+            firstname="Test",
+            lastname="User",
+            username=f"user{index}",
+            email=f"user{index}@example.com",
+            password_hash="unused",
+            is_admin=is_admin,
+        )
+        user.wallet = Wallet()
+        db.session.add(user)
+        db.session.commit()
+        users.append(user)
+    return users
+
+
+def auth_headers(user):
+    token = create_access_token(identity=user.id, additional_claims=token_claims(user))
+    return {"Authorization": f"Bearer {token}"}
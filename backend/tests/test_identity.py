@@ -0,0 +1,41 @@
+"""
+Script Name : test_identity.py
+Description : Authorization flags follow the DB, deleted users are turned away
+Author      : @tonybnya
+"""
+
+import pytest
+from flask_jwt_extended import current_user, verify_jwt_in_request
+from flask_jwt_extended.exceptions import UserLookupError
+from core import db
+from users.models import User
+from .conftest import add_users, auth_headers
+
+
+def test_demoted_admin_loses_access_despite_the_token(client):
+    (admin,) = add_users(1, is_admin=True)
+    headers = auth_headers(admin)
+    assert client.get("/users/all", headers=headers).status_code == 200
+
+    (other,) = add_users(1, is_admin=True)
+    demote = {"is_admin": False}
+    client.put(f"/users/{admin.id}", json=demote, headers=auth_headers(other))
+
+    assert client.get("/users/all", headers=headers).status_code == 403
+
+
+def test_user_deleted_while_cached_is_a_401(app, client):
+    (user,) = add_users(1)
+    user_id, headers = user.id, auth_headers(user)
+    client.get("/wallets/me", headers=headers)  # caches the flags
+    # deleted through another process, whose cache invalidation doesn't reach us
+    db.session.execute(User.__table__.delete().where(User.id == user_id))
+    db.session.commit()
+
+    with app.test_request_context(headers=headers):
+        verify_jwt_in_request()
+        with pytest.raises(UserLookupError) as error:
+            current_user.username
+        response = app.handle_user_exception(error.value)
+
+    assert response.status_code == 401
@@ -0,0 +1,33 @@
+"""
+Script Name : test_importer.py
+Description : Bulk imports report bad rows individually instead of failing the batch
+Author      : @tonybnya
+"""
+
+from users.importer import _validate
+
+
+def user_row(**fields):
+    row = {
+        "firstname": "Ada",
+        "lastname": "Lovelace",
+        "username": "ada",
+        "email": "ada@example.com",
+        "password": "secret-password",
+    }
+    row.update(fields)
+    return row
+
+
+def test_fields_longer_than_their_column_fail_their_row():
+    rows = [
+        user_row(),
+        user_row(username="b" * 81, email="b@example.com"),
+        user_row(username="c", email="c" * 110 + "@example.com"),
+    ]
+
+    report = _validate(rows)
+
+    assert [entry["status"] for entry in report] == ["pending", "failed", "failed"]
+    assert report[1]["error"] == "username must be at most 80 characters long"
+    assert report[2]["error"] == "email must be at most 120 characters long"
@@ -0,0 +1,205 @@
+"""
+Script Name : test_ledger.py
+Description : Money movements stay consistent under concurrency, retries and replays
+Author      : @tonybnya
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+import pytest
+from sqlalchemy.exc import OperationalError
+from core import db
+from transactions.ledger import LOCK_MODES, retry_stats, run_with_retry
+from users.models import IdempotencyKey, Transaction, Wallet, generate_id
+from .conftest import add_users, auth_headers
+
+
+def fund(headers, amount):
+    """Set the wallets' balances directly, `headers` maps users to auth headers."""
+    for user_id in headers:
+        Wallet.query.filter_by(user_id=user_id).update({"balance": amount})
+    db.session.commit()
+
+
+def balance_of(user_id):
+    db.session.expire_all()
+    return Wallet.query.filter_by(user_id=user_id).one().balance
+
+
+def run_concurrently(app, requests, clients=8):
+    """POST every (url, json, headers) from `clients` threads, return the statuses."""
+
+    def post(args):
+        url, payload, headers = args
+        return app.test_client().post(url, json=payload, headers=headers).status_code
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        return list(pool.map(post, requests))
+
+
+@pytest.fixture
+def users(app):
+    """{user_id: auth headers} of two users."""
+    return {user.id: auth_headers(user) for user in add_users(2)}
+
+
+@pytest.mark.parametrize("mode", LOCK_MODES)
+def test_concurrent_withdrawals_never_overdraw(app, users, mode):
+    app.config["LEDGER_LOCK_MODE"] = mode
+    user_id, headers = next(iter(users.items()))
+    fund({user_id: headers}, Decimal("100.00"))
+
+    statuses = run_concurrently(
+        app, [("/transactions/withdraw", {"amount": "10"}, headers)] * 20
+    )
+
+    assert statuses.count(201) == 10
+    assert set(statuses) <= {201, 400, 409}
+    assert balance_of(user_id) == Decimal("0.00")
+    withdrawals = Transaction.query.filter_by(transaction_type="WITHDRAWAL").count()
+    assert withdrawals == 10
+
+
+@pytest.mark.parametrize("mode", LOCK_MODES)
+def test_opposite_transfers_conserve_money(app, users, mode):
+    app.config["LEDGER_LOCK_MODE"] = mode
+    (alice, alice_headers), (bob, bob_headers) = users.items()
+    fund(users, Decimal("50.00"))
+
+    url = "/transactions/transfer"
+    requests = []
+    for _ in range(10):
+        requests.append((url, {"to_user_id": bob, "amount": "3"}, alice_headers))
+        requests.append((url, {"to_user_id": alice, "amount": "2"}, bob_headers))
+    statuses = run_concurrently(app, requests)
+
+    # optimistic writers may run out of retries (409), nothing else fails
+    assert set(statuses) <= {200, 409}
+    to_bob = statuses[0::2].count(200)
+    to_alice = statuses[1::2].count(200)
+    assert balance_of(alice) == Decimal("50.00") - 3 * to_bob + 2 * to_alice
+    assert balance_of(bob) == Decimal("50.00") + 3 * to_bob - 2 * to_alice
+    assert Transaction.query.count() == 2 * (to_bob + to_alice)
+
+
+def test_lock_modes_agree_on_the_same_inputs(app, client, users):
+    (alice, alice_headers), (bob, _) = users.items()
+    operations = [
+        ("/transactions/deposit", {"amount": "70"}),
+        ("/transactions/deposit", {"amount": "0.001"}),
+        ("/transactions/deposit", {"amount": "0.005"}),
+        ("/transactions/withdraw", {"amount": "10.125"}),
+        ("/transactions/transfer", {"to_user_id": bob, "amount": "12.345"}),
+    ]
+    outcomes = {}
+    for mode in LOCK_MODES:
+        app.config["LEDGER_LOCK_MODE"] = mode
+        fund(users, Decimal("0.00"))
+        responses = [
+            client.post(url, json=payload, headers=alice_headers).get_json()["data"]
+            for url, payload in operations
+        ]
+        outcomes[mode] = (
+            [data.get("new_balance") for data in responses],
+            balance_of(alice),
+            balance_of(bob),
+        )
+
+    pessimistic, optimistic = outcomes.values()
+    assert optimistic == pessimistic
+    new_balances, alice_balance, bob_balance = optimistic
+    assert new_balances[:4] == [70, 70, 70.01, 59.88]
+    assert (alice_balance, bob_balance) == (Decimal("47.53"), Decimal("12.35"))
+
+
+def test_idempotent_replay_returns_the_same_transaction(client, users):
+    user_id, headers = next(iter(users.items()))
+    headers = {**headers, "Idempotency-Key": "deposit-1"}
+
+    first = client.post("/transactions/deposit", json={"amount": "25"}, headers=headers)
+    replay = client.post("/transactions/deposit", json={"amount": "25"}, headers=headers)
+
+    assert first.status_code == replay.status_code == 201
+    assert replay.get_json() == first.get_json()
+    assert balance_of(user_id) == Decimal("25.00")
+    assert Transaction.query.count() == 1
+
+
+def test_idempotency_key_rejects_a_different_request(client, users):
+    _, headers = next(iter(users.items()))
+    headers = {**headers, "Idempotency-Key": "deposit-2"}
+
+    client.post("/transactions/deposit", json={"amount": "25"}, headers=headers)
+    other = client.post("/transactions/deposit", json={"amount": "30"}, headers=headers)
+
+    assert other.status_code == 422
+    assert Transaction.query.count() == 1
+
+
+def test_abandoned_idempotency_key_is_taken_over(app, client, users):
+    user_id, headers = next(iter(users.items()))
+    headers = {**headers, "Idempotency-Key": "deposit-3"}
+    payload = {"amount": "25"}
+    # a worker died between reserving the key and storing the response
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    record = IdempotencyKey(
+        id=generate_id(),
+        user_id=user_id,
+        key="deposit-3",
+        endpoint="transactions.deposit",
+        request_hash="",
+        created_at=now,
+        expires_at=now + timedelta(hours=1),
+    )
+    db.session.add(record)
+    db.session.commit()
+
+    in_flight = client.post("/transactions/deposit", json=payload, headers=headers)
+    record.created_at = now - timedelta(
+        seconds=app.config["IDEMPOTENCY_IN_FLIGHT_TIMEOUT"] + 1
+    )
+    db.session.commit()
+    retry = client.post("/transactions/deposit", json=payload, headers=headers)
+    replay = client.post("/transactions/deposit", json=payload, headers=headers)
+
+    assert in_flight.status_code == 409
+    assert retry.status_code == replay.status_code == 201
+    assert replay.get_json() == retry.get_json()
+    assert balance_of(user_id) == Decimal("25.00")
+
+
+def test_lost_race_is_replayed(app):
+    retry_stats.update(retries=0, exhausted=0)
+    attempts = []
+
+    def unit_of_work():
+        attempts.append(generate_id())
+        if len(attempts) == 1:
+            raise OperationalError("UPDATE wallets", {}, Exception("database is locked"))
+        return "done"
+
+    assert run_with_retry(unit_of_work) == "done"
+    assert len(attempts) == 2
+    assert retry_stats["retries"] == 1
+
+
+def test_batch_rejects_malformed_recipients_per_item(client, users):
+    (alice, alice_headers), (bob, _) = users.items()
+    fund({alice: alice_headers}, Decimal("50.00"))
+    transfers = [
+        {"to_user_id": {"id": bob}, "amount": "5"},
+        {"to_user_id": ["x"], "amount": "5"},
+        {"to_user_id": bob, "amount": "5"},
+    ]
+
+    response = client.post(
+        "/transactions/transfer/batch",
+        json={"mode": "best_effort", "transfers": transfers},
+        headers=alice_headers,
+    )
+
+    results = response.get_json()["data"]["results"]
+    assert [result["error"] for result in results[:2]] == ["Invalid to_user_id"] * 2
+    assert results[2]["status"] == "success"
+    assert balance_of(bob) == Decimal("5.00")
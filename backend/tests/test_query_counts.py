@@ -0,0 +1,45 @@
+"""
+Script Name : test_query_counts.py
+Description : Listing endpoints must run the same number of queries whatever the row count
+Author      : @tonybnya
+"""
+
+import pytest
+from sqlalchemy import event
+from core import db
+from .conftest import add_users, auth_headers
+
+LISTINGS = ["/users?per_page=100", "/users/all"]
+
+
+def count_queries(client, url, headers):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        response = client.get(url, headers=headers)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+    assert response.status_code == 200, response.get_json()
+    return len(statements), response.get_json()["count"]
+
+
+@pytest.mark.parametrize("url", LISTINGS)
+def test_listing_query_count_does_not_grow_with_rows(client, url):
+    (admin,) = add_users(1, is_admin=True)
+    headers = auth_headers(admin)
+
+    add_users(5)
+    # the first request also caches the caller's authorization flags
+    client.get(url, headers=headers)
+    queries, rows = count_queries(client, url, headers)
+    assert rows == 6
+
+    add_users(6)
+    queries_doubled, rows = count_queries(client, url, headers)
+    assert rows == 12
+
+    assert queries_doubled == queries
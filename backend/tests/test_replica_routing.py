@@ -0,0 +1,95 @@
+"""
+Script Name : test_replica_routing.py
+Description : Reads of read-only endpoints go to the replica, except right after a write
+Author      : @tonybnya
+"""
+
+import shutil
+import sqlite3
+import pytest
+from core import db
+from core.replica import STICKY_HEADER
+from .conftest import add_users, auth_headers
+
+LAGGING_BALANCE = 999.0
+
+
+@pytest.fixture
+def config_overrides(tmp_path):
+    return {
+        "SQLALCHEMY_BINDS": {"replica": f"sqlite:///{tmp_path / 'replica.db'}"},
+        "REPLICA_STICKY_SECONDS": 60,
+    }
+
+
+@pytest.fixture
+def users(app, tmp_path):
+    """Auth headers of two users, with a replica whose balances lag behind."""
+    headers = [auth_headers(user) for user in add_users(2)]
+    db.session.remove()
+    db.engines[None].dispose()
+    shutil.copy(tmp_path / "test.db", tmp_path / "replica.db")
+    replica = sqlite3.connect(tmp_path / "replica.db")
+    replica.execute("UPDATE wallets SET balance = ?", (LAGGING_BALANCE,))
+    replica.commit()
+    replica.close()
+    return headers
+
+
+def balance(client, headers, read_primary=None):
+    if read_primary is not None:
+        headers = {**headers, STICKY_HEADER: read_primary}
+    response = client.get("/wallets/me", headers=headers)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()["data"]["balance"]
+
+
+def test_reads_go_to_the_replica(client, users):
+    alice, _ = users
+    assert balance(client, alice) == LAGGING_BALANCE
+
+
+def test_writer_reads_the_primary_from_any_worker(app, client, users):
+    alice, _ = users
+    response = client.post(
+        "/transactions/deposit", json={"amount": 10}, headers=alice
+    )
+    assert response.status_code == 201
+    token = response.headers.get(STICKY_HEADER)
+    assert token is not None
+
+    # echoed by a fresh client, as a request served elsewhere
+    assert balance(app.test_client(), alice, token) == 10.0
+    assert balance(app.test_client(), alice) == LAGGING_BALANCE
+
+
+def test_read_primary_header_is_exposed_cross_origin(client, users):
+    alice, _ = users
+    response = client.post(
+        "/transactions/deposit",
+        json={"amount": 10},
+        headers={**alice, "Origin": "http://localhost:5173"},
+    )
+    exposed = response.headers["Access-Control-Expose-Headers"]
+    assert STICKY_HEADER in exposed.split(", ")
+
+
+def test_sticky_token_only_pins_its_writer(client, users):
+    alice, bob = users
+    response = client.post("/transactions/deposit", json={"amount": 10}, headers=alice)
+    token = response.headers[STICKY_HEADER]
+    assert balance(client, bob, token) == LAGGING_BALANCE
+    assert balance(client, alice, "not-signed") == LAGGING_BALANCE
+
+
+def test_search_checks_the_replica_for_its_index(client, users, tmp_path):
+    alice, _ = users
+    # the primary has the FTS index, the replica was never given one
+    replica = sqlite3.connect(tmp_path / "replica.db")
+    replica.execute("DROP TABLE users_fts")
+    replica.close()
+
+    response = client.get("/users/search?q=user", headers=alice)
+
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()["count"] == 2
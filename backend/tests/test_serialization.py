@@ -0,0 +1,19 @@
+"""
+Script Name : test_serialization.py
+Description : The JSON provider keeps Flask's response formats
+Author      : @tonybnya
+"""
+
+import pytest
+from werkzeug.http import parse_date
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_datetimes_keep_the_http_date_format(app, client, use_orjson):
+    app.json.fast = use_orjson
+
+    timestamp = client.get("/health").get_json()["timestamp"]
+
+    assert timestamp.endswith(" GMT")
+    assert parse_date(timestamp) is not None
+
@@ -0,0 +1,186 @@
+"""
+Script Name : analytics.py
+Description : SQL-side aggregation of wallet activity into date buckets
+Author      : @tonybnya
+"""
+
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from sqlalchemy import Date, cast, delete, func, insert, select
+from core import db
+from users.models import Transaction, Wallet, WalletDailyStat
+
+GRANULARITIES = ["day", "week", "month"]
+REVENUE_TYPES = {"DEPOSIT", "TRANSFER_IN"}
+SPENDING_TYPES = {"WITHDRAWAL", "TRANSFER_OUT"}
+
+
+def bucket_expression(granularity, column):
+    """Truncate `column` to the start date of its bucket, in SQL.
+
+    Weeks start on Monday on both backends.
+    """
+    if db.session.get_bind().dialect.name == "sqlite":
+        modifiers = {
+            "day": (),
+            "week": ("-6 days", "weekday 1"),
+            "month": ("start of month",),
+        }[granularity]
+        return func.date(column, *modifiers)
+    return cast(func.date_trunc(granularity, column), Date)
+
+
+def truncate(granularity, day):
+    """Python twin of `bucket_expression` for a single date."""
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _next_bucket(granularity, day):
+    if granularity == "day":
+        return day + timedelta(days=1)
+    if granularity == "week":
+        return day + timedelta(weeks=1)
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def window_start(months, today=None):
+    """First day of the month `months - 1` months before `today`."""
+    today = today or datetime.now(timezone.utc).date()
+    year, month = divmod(today.year * 12 + today.month - 1 - (months - 1), 12)
+    return date(year, month + 1, 1)
+
+
+def period_starts(granularity, start, end):
+    """Every bucket start from `start` up to `end`.
+
+    The first bucket is labelled `start` itself: a week straddling the
+    window start only holds the days from `start` on.
+    """
+    yield start
+    day = _next_bucket(granularity, truncate(granularity, start))
+    while day <= end:
+        yield day
+        day = _next_bucket(granularity, day)
+
+
+def _as_date(value):
+    # SQLite hands the bucket back as text, Postgres as a date
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def empty_bucket(period):
+    return {
+        "period": period.isoformat(),
+        "revenue": Decimal("0"),
+        "spending": Decimal("0"),
+        "net": Decimal("0"),
+        "count": 0,
+        "by_type": {},
+    }
+
+
+def add_to_bucket(bucket, tx_type, count, amount):
+    bucket["count"] += count
+    bucket["by_type"][tx_type] = {"count": count, "amount": amount}
+    if tx_type in REVENUE_TYPES:
+        bucket["revenue"] += amount
+    elif tx_type in SPENDING_TYPES:
+        bucket["spending"] += amount
+    bucket["net"] = bucket["revenue"] - bucket["spending"]
+
+
+def summarize(wallet_id, granularity, months):
+    """Return (start, buckets) of the wallet activity, oldest bucket first.
+
+    Reads the wallet_daily_stats rollup, so a 6-month report groups at most
+    a few hundred rows whatever the wallet volume; empty buckets are filled
+    in Python so charts get a steady axis.
+    """
+    start = window_start(months)
+    bucket = bucket_expression(granularity, WalletDailyStat.day).label("bucket")
+
+    rows = db.session.execute(
+        select(
+            bucket,
+            WalletDailyStat.transaction_type,
+            func.sum(WalletDailyStat.count),
+            func.sum(WalletDailyStat.amount),
+        )
+        .where(WalletDailyStat.wallet_id == wallet_id, WalletDailyStat.day >= start)
+        .group_by(bucket, WalletDailyStat.transaction_type)
+    ).all()
+
+    today = datetime.now(timezone.utc).date()
+    buckets = {
+        period: empty_bucket(period)
+        for period in period_starts(granularity, start, today)
+    }
+    for period, tx_type, count, amount in rows:
+        # the rows of a partial first week are filed under the window start
+        period = max(_as_date(period), start)
+        if period not in buckets:
+            buckets[period] = empty_bucket(period)
+        add_to_bucket(buckets[period], tx_type, count, Decimal(amount or 0))
+
+    return start, [buckets[period] for period in sorted(buckets)]
+
+
+def daily_report(date_from, date_to):
+    """Cross-wallet totals per day and type between two dates, inclusive."""
+    return db.session.execute(
+        select(
+            WalletDailyStat.day,
+            WalletDailyStat.transaction_type,
+            func.sum(WalletDailyStat.count),
+            func.sum(WalletDailyStat.amount),
+        )
+        .where(WalletDailyStat.day >= date_from, WalletDailyStat.day <= date_to)
+        .group_by(WalletDailyStat.day, WalletDailyStat.transaction_type)
+        .order_by(WalletDailyStat.day, WalletDailyStat.transaction_type)
+    ).all()
+
+
+def rebuild_daily_stats(chunk_size=500):
+    """Recompute wallet_daily_stats from transactions, `chunk_size` wallets at a time.
+
+    Each chunk is replaced and committed on its own, so the rebuild never
+    holds one huge transaction; run it while writes are paused to get an
+    exact snapshot. Returns the number of wallets processed.
+    """
+    day = bucket_expression("day", Transaction.created_at)
+    processed = 0
+    last_id = None
+
+    while True:
+        query = select(Wallet.id).order_by(Wallet.id).limit(chunk_size)
+        if last_id is not None:
+            query = query.where(Wallet.id > last_id)
+        wallet_ids = db.session.scalars(query).all()
+        if not wallet_ids:
+            return processed
+
+        db.session.execute(
+            delete(WalletDailyStat).where(WalletDailyStat.wallet_id.in_(wallet_ids))
+        )
+        db.session.execute(
+            insert(WalletDailyStat).from_select(
+                ["wallet_id", "day", "transaction_type", "count", "amount"],
+                select(
+                    Transaction.wallet_id,
+                    day,
+                    Transaction.transaction_type,
+                    func.count(Transaction.id),
+                    func.sum(Transaction.amount),
+                )
+                .where(Transaction.wallet_id.in_(wallet_ids))
+                .group_by(Transaction.wallet_id, day, Transaction.transaction_type),
+            )
+        )
+        db.session.commit()
+
+        processed += len(wallet_ids)
+        last_id = wallet_ids[-1]
@@ -0,0 +1,76 @@
+"""
+Script Name : commands.py
+Description : Flask CLI commands for transactions maintenance
+Author      : @tonybnya
+"""
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import inspect
+from core import db
+from .analytics import rebuild_daily_stats as rebuild
+from .idempotency import purge_expired
+from .reconcile import reconcile as run_reconcile
+
+
+@click.command("purge-idempotency-keys")
+@with_appcontext
+def purge_idempotency_keys():
+    """Delete expired Idempotency-Key records."""
+    click.echo(f"Deleted {purge_expired()} expired idempotency keys")
+
+
+@click.command("create-indexes")
+@with_appcontext
+def create_indexes():
+    """Create the model indexes an existing database is missing.
+
+    create_all() only builds the indexes of new tables; run this after an
+    upgrade that added some, e.g. the (wallet_id, created_at, id) history
+    index. Plain CREATE INDEX: writes to the table wait for the build.
+    """
+    with db.engine.begin() as conn:
+        inspector = inspect(conn)
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(conn)
+                    click.echo(f"Created {index.name} on {table.name}")
+    click.echo("Indexes are up to date")
+
+
+@click.command("rebuild-daily-stats")
+@click.option("--chunk-size", default=500, show_default=True, help="Wallets per chunk.")
+@with_appcontext
+def rebuild_daily_stats(chunk_size):
+    """Recompute the wallet_daily_stats rollup from the transactions table."""
+    click.echo(f"Rebuilt daily stats of {rebuild(chunk_size)} wallets")
+
+
+@click.command("reconcile")
+@click.option("--chunk-size", default=500, show_default=True, help="Wallets per chunk.")
+@click.option("--workers", default=4, show_default=True, help="Chunks run in parallel.")
+@click.option(
+    "--lag",
+    default=300,
+    show_default=True,
+    help="Seconds a transaction must age before it is folded into a checkpoint.",
+)
+@click.option("--full", is_flag=True, help="Ignore checkpoints and sum every transaction.")
+@with_appcontext
+def reconcile(chunk_size, workers, lag, full):
+    """Check every wallet balance against the signed sum of its transactions."""
+    report = run_reconcile(chunk_size, workers, lag, full)
+    click.echo(
+        f"Checked {report['wallets']} wallets, scanned {report['scanned']} transactions"
+    )
+    for drift in report["drifts"]:
+        click.echo(
+            f"DRIFT wallet={drift['wallet_id']} balance={drift['balance']} "
+            f"expected={drift['expected']} drift={drift['drift']}"
+        )
+    if report["drifts"]:
+        raise click.exceptions.Exit(1)
@@ -0,0 +1,236 @@
+"""
+Script Name : idempotency.py
+Description : Idempotency-Key support for the money-moving endpoints
+Author      : @tonybnya
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from flask import current_app, g, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from core import db
+from users.models import IdempotencyKey, generate_id
+from utils import make_response
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+
+class ResponseCache:
+    """Thread-safe LRU of stored responses, keyed by (user_id, key)."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cache_key):
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            if entry["expires_at"] <= _now():
+                del self._entries[cache_key]
+                return None
+            self._entries.move_to_end(cache_key)
+            return entry
+
+    def put(self, cache_key, entry, max_size):
+        with self._lock:
+            self._entries[cache_key] = entry
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache()
+
+
+def _now():
+    # stored naive, like every other DateTime column of the app
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _replay(entry):
+    response = current_app.response_class(
+        entry["response_body"],
+        status=entry["status_code"],
+        mimetype="application/json",
+    )
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def purge_expired():
+    """Delete every expired key, return how many rows were removed."""
+    result = db.session.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.expires_at <= _now())
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def _release(record_id):
+    """Drop an in-flight reservation so the client can retry the request."""
+    db.session.rollback()
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.id == record_id))
+    db.session.commit()
+
+
+def _abandoned(record):
+    timeout = timedelta(seconds=current_app.config["IDEMPOTENCY_IN_FLIGHT_TIMEOUT"])
+    return record.created_at is not None and record.created_at <= _now() - timeout
+
+
+def idempotent(fn):
+    """Replay the stored response when a request repeats its Idempotency-Key.
+
+    The first request reserves the key, runs the endpoint and stores its
+    response when it succeeded, in the same transaction as the money
+    movement. Repeats are served from the per-process LRU first and from
+    the idempotency_keys table otherwise, without ever reaching the
+    endpoint. Failed requests release the key, since nothing was applied
+    and retrying them is harmless; so is a reservation still without
+    response after IDEMPOTENCY_IN_FLIGHT_TIMEOUT, its request having died
+    before committing anything.
+    """
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return fn(*args, **kwargs)
+
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return make_response(
+                error=f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters long",
+                status=400,
+            )
+
+        user_id = get_jwt_identity()
+        cache_key = (user_id, key)
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+
+        entry = response_cache.get(cache_key)
+        if entry is None:
+            record = IdempotencyKey.query.filter_by(user_id=user_id, key=key).first()
+            if record and record.expires_at <= _now():
+                db.session.delete(record)
+                db.session.commit()
+                record = None
+
+            if record and record.status_code is None and _abandoned(record):
+                # the money moves in the transaction storing the response, so
+                # a reservation left without one never moved anything
+                db.session.delete(record)
+                db.session.commit()
+                record = None
+
+            if record and record.status_code is None:
+                return make_response(
+                    error=f"A request with this {HEADER} is still in progress",
+                    status=409,
+                )
+
+            if record:
+                entry = {
+                    "endpoint": record.endpoint,
+                    "request_hash": record.request_hash,
+                    "status_code": record.status_code,
+                    "response_body": record.response_body,
+                    "expires_at": record.expires_at,
+                }
+                response_cache.put(
+                    cache_key, entry, current_app.config["IDEMPOTENCY_CACHE_SIZE"]
+                )
+
+        if entry is not None:
+            if (
+                entry["endpoint"] != request.endpoint
+                or entry["request_hash"] != request_hash
+            ):
+                return make_response(
+                    error=f"{HEADER} was already used for a different request",
+                    status=422,
+                )
+            return _replay(entry)
+
+        # reserve the key first: a concurrent duplicate hits the unique
+        # constraint instead of moving the money a second time
+        entry = {
+            "endpoint": request.endpoint,
+            "request_hash": request_hash,
+            "expires_at": _now()
+            + timedelta(seconds=current_app.config["IDEMPOTENCY_TTL"]),
+        }
+        record_id = generate_id()
+        record = IdempotencyKey(
+            id=record_id,
+            user_id=user_id,
+            key=key,
+            endpoint=entry["endpoint"],
+            request_hash=request_hash,
+            created_at=_now(),
+            expires_at=entry["expires_at"],
+        )
+        try:
+            db.session.add(record)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return make_response(
+                error=f"A request with this {HEADER} is still in progress",
+                status=409,
+            )
+
+        g.idempotency_key_id = record_id
+        try:
+            response = current_app.make_response(fn(*args, **kwargs))
+        except Exception:
+            _release(record_id)
+            raise
+        finally:
+            g.pop("idempotency_key_id", None)
+
+        if response.status_code >= 400:
+            _release(record_id)
+            return response
+
+        entry["status_code"] = response.status_code
+        entry["response_body"] = response.get_data(as_text=True)
+        try:
+            stored = db.session.execute(
+                update(IdempotencyKey)
+                .where(
+                    IdempotencyKey.id == record_id,
+                    IdempotencyKey.status_code.is_(None),
+                )
+                .values(
+                    status_code=entry["status_code"],
+                    response_body=entry["response_body"],
+                )
+            ).rowcount
+            if not stored:
+                # taken over as abandoned by a retry, which owns the outcome
+                db.session.rollback()
+                return make_response(
+                    error=f"A request with this {HEADER} is still in progress",
+                    status=409,
+                )
+            db.session.commit()
+        except Exception:
+            _release(record_id)
+            raise
+        response_cache.put(cache_key, entry, current_app.config["IDEMPOTENCY_CACHE_SIZE"])
+
+        return response
+
+    return wrapper
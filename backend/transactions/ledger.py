@@ -0,0 +1,265 @@
+"""
+Script Name : ledger.py
+Description : Atomic, SQL-side balance mutations for wallets
+Author      : @tonybnya
+"""
+
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from decimal import ROUND_HALF_UP, Decimal
+from flask import current_app, g
+from sqlalchemy import case, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm.exc import StaleDataError
+from core import db
+from users.models import Transaction, Wallet, WalletDailyStat, generate_id
+
+# "pessimistic": conditional UPDATEs and SELECT ... FOR UPDATE, writers queue
+# on row locks; "optimistic": read, then write guarded by the wallet version,
+# a writer that lost the race gets StaleDataError and replays
+LOCK_MODES = ("pessimistic", "optimistic")
+
+# SQLSTATEs Postgres raises when a transaction lost a race and can be replayed
+RETRYABLE_SQLSTATES = {"40001", "40P01"}  # serialization_failure, deadlock_detected
+
+# balances are stored in cents: amounts are rounded the way Postgres rounds
+# them into Numeric(20, 2), so every lock mode and backend moves the same sum
+CENT = Decimal(1).scaleb(-Wallet.__table__.c.balance.type.scale)
+
+_stats_lock = threading.Lock()
+retry_stats = {"retries": 0, "exhausted": 0}
+
+
+class LedgerError(Exception):
+    """Base class for balance mutation failures."""
+
+
+class WalletNotFound(LedgerError):
+    """The targeted wallet does not exist."""
+
+
+class InsufficientBalance(LedgerError):
+    """The wallet balance does not cover the debit."""
+
+
+class ConcurrencyConflict(LedgerError):
+    """The unit of work kept losing lock races and ran out of retries."""
+
+
+def _apply(criteria, new_balance):
+    # single round trip: the balance check and the write happen in one
+    # statement, so concurrent writers can't lose each other's updates
+    return db.session.execute(
+        update(Wallet)
+        .where(*criteria)
+        .values(balance=new_balance, version=Wallet.version + 1)
+        .returning(Wallet.id, Wallet.balance)
+        .execution_options(synchronize_session=False)
+    ).first()
+
+
+def _cents(amount):
+    return Decimal(amount).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _optimistic():
+    return current_app.config["LEDGER_LOCK_MODE"] == "optimistic"
+
+
+def _apply_versioned(user_id, delta):
+    # no row lock: the flush issues UPDATE ... WHERE id = ? AND version = ?
+    # and raises StaleDataError when another writer got there first
+    wallet = db.session.scalars(
+        select(Wallet).where(Wallet.user_id == user_id)
+    ).one_or_none()
+    if wallet is None:
+        raise WalletNotFound(user_id)
+    if wallet.balance + delta < 0:
+        raise InsufficientBalance(user_id)
+    wallet.balance = _cents(wallet.balance + delta)
+    db.session.flush()
+    return wallet.id, wallet.balance
+
+
+def credit(user_id, amount):
+    """Add `amount` to the user's wallet, return (wallet_id, new_balance)."""
+    amount = _cents(amount)
+    if _optimistic():
+        return _apply_versioned(user_id, amount)
+    row = _apply([Wallet.user_id == user_id], Wallet.balance + amount)
+    if row is None:
+        raise WalletNotFound(user_id)
+    return row.id, row.balance
+
+
+def debit(user_id, amount):
+    """Remove `amount` from the user's wallet, return (wallet_id, new_balance)."""
+    amount = _cents(amount)
+    if _optimistic():
+        return _apply_versioned(user_id, -amount)
+    row = _apply(
+        [Wallet.user_id == user_id, Wallet.balance >= amount],
+        Wallet.balance - amount,
+    )
+    if row is None:
+        # only the failure path pays for a second query to tell both cases apart
+        exists = db.session.execute(
+            select(Wallet.id).where(Wallet.user_id == user_id)
+        ).first()
+        if exists is None:
+            raise WalletNotFound(user_id)
+        raise InsufficientBalance(user_id)
+    return row.id, row.balance
+
+
+def dialect_insert(table):
+    """INSERT that supports on_conflict_do_update() on the bound backend."""
+    dialect = postgresql if db.session.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(table)
+
+
+def update_daily_stats(rows):
+    """Fold new transaction rows into wallet_daily_stats with one upsert."""
+    totals = {}
+    for row in rows:
+        key = (row["wallet_id"], row["created_at"].date(), row["transaction_type"])
+        count, amount = totals.get(key, (0, 0))
+        totals[key] = (count + 1, amount + row["amount"])
+
+    table = WalletDailyStat.__table__
+    stmt = dialect_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["wallet_id", "day", "transaction_type"],
+        set_={
+            "count": table.c["count"] + stmt.excluded["count"],
+            "amount": table.c["amount"] + stmt.excluded["amount"],
+        },
+    )
+    # sorted, so concurrent writers lock the rollup rows in the same order
+    db.session.execute(
+        stmt,
+        [
+            {
+                "wallet_id": wallet_id,
+                "day": day,
+                "transaction_type": tx_type,
+                "count": count,
+                "amount": amount,
+            }
+            for (wallet_id, day, tx_type), (count, amount) in sorted(totals.items())
+        ],
+    )
+
+
+def record_transactions(rows):
+    """Insert Transaction rows and their rollup in the current DB transaction.
+
+    `rows` are dicts with wallet_id, amount and transaction_type; id and
+    created_at are filled in when missing. Returns the completed rows.
+    """
+    now = datetime.now(timezone.utc)
+    for row in rows:
+        row.setdefault("id", generate_id())
+        row.setdefault("created_at", now)
+
+    db.session.execute(insert(Transaction), rows)
+    update_daily_stats(rows)
+    return rows
+
+
+def lock_wallets(*user_ids):
+    """Lock the users' wallets in wallet id order, return {user_id: (id, balance)}.
+
+    Every writer takes the row locks in the same order, so two opposite
+    transfers queue behind each other instead of deadlocking. In optimistic
+    mode nothing is locked, the versioned writes detect the conflicts.
+    """
+    stmt = (
+        select(Wallet.id, Wallet.user_id, Wallet.balance)
+        .where(Wallet.user_id.in_(user_ids))
+        .order_by(Wallet.id)
+    )
+    if not _optimistic():
+        stmt = stmt.with_for_update()
+    rows = db.session.execute(stmt).all()
+    return {row.user_id: row for row in rows}
+
+
+def credit_many(amounts):
+    """Credit several wallets in one statement, `amounts` is {wallet_id: amount}."""
+    if not amounts:
+        return
+    amounts = {wallet_id: _cents(amount) for wallet_id, amount in amounts.items()}
+    db.session.execute(
+        update(Wallet)
+        .where(Wallet.id.in_(amounts))
+        .values(
+            # comparisons rather than case(amounts, value=...), whose WHEN
+            # values would skip the id column's bind processing
+            balance=Wallet.balance
+            + case(
+                *(
+                    (Wallet.id == wallet_id, amount)
+                    for wallet_id, amount in amounts.items()
+                )
+            ),
+            version=Wallet.version + 1,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def is_retryable(error):
+    """Tell whether a DB error is a lost race that is safe to replay."""
+    orig = getattr(error, "orig", None)
+    sqlstate = getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)
+    if sqlstate in RETRYABLE_SQLSTATES:
+        return True
+    # SQLite reports writer contention as a plain OperationalError
+    return "database is locked" in str(orig)
+
+
+def _record(key):
+    with _stats_lock:
+        retry_stats[key] += 1
+
+
+def run_with_retry(unit_of_work):
+    """Run `unit_of_work` and commit, replaying it when it lost a race.
+
+    Serialization failures, deadlocks and stale wallet versions are
+    replayed, at most LEDGER_MAX_RETRIES times and spaced with full-jitter
+    exponential backoff starting at LEDGER_RETRY_BASE_DELAY seconds. Under
+    @idempotent the work is only flushed: the decorator commits it in the
+    same transaction as the stored response.
+    """
+    max_retries = current_app.config["LEDGER_MAX_RETRIES"]
+    base_delay = current_app.config["LEDGER_RETRY_BASE_DELAY"]
+
+    for attempt in range(max_retries + 1):
+        try:
+            result = unit_of_work()
+            if g.get("idempotency_key_id"):
+                # @idempotent commits it together with the stored response
+                db.session.flush()
+            else:
+                db.session.commit()
+            return result
+        except (DBAPIError, StaleDataError) as e:
+            db.session.rollback()
+            if isinstance(e, DBAPIError) and not is_retryable(e):
+                raise
+            if attempt == max_retries:
+                _record("exhausted")
+                raise ConcurrencyConflict() from e
+            _record("retries")
+            current_app.logger.warning(
+                "Ledger conflict, retrying (attempt %d/%d): %s",
+                attempt + 1,
+                max_retries,
+                getattr(e, "orig", e),
+            )
+            time.sleep(random.uniform(0, base_delay * 2**attempt))
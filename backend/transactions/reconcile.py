@@ -0,0 +1,152 @@
+"""
+Script Name : reconcile.py
+Description : Check wallet balances against the signed sum of their transactions
+Author      : @tonybnya
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from flask import current_app
+from sqlalchemy import and_, case, func, or_, select
+from core import db
+from users.models import Transaction, Wallet, WalletCheckpoint
+from .analytics import REVENUE_TYPES
+from .ledger import dialect_insert
+
+
+def _signed_amount():
+    return case(
+        (Transaction.transaction_type.in_(REVENUE_TYPES), Transaction.amount),
+        else_=-Transaction.amount,
+    )
+
+
+def _wallet_chunks(chunk_size):
+    last_id = None
+    while True:
+        query = select(Wallet.id).order_by(Wallet.id).limit(chunk_size)
+        if last_id is not None:
+            query = query.where(Wallet.id > last_id)
+        wallet_ids = db.session.scalars(query).all()
+        if not wallet_ids:
+            return
+        yield wallet_ids
+        last_id = wallet_ids[-1]
+
+
+def reconcile_chunk(wallet_ids, horizon, full=False):
+    """Reconcile a chunk of wallets, return (drifts, transactions_scanned).
+
+    Only transactions newer than each wallet's checkpoint are summed. The
+    wallet balance, checkpoint and sums are read by one statement, so they
+    come from the same snapshot even while money keeps moving. Rows older
+    than `horizon` are folded into the checkpoint; newer ones are summed
+    but left for the next run, so a transaction that commits late with an
+    older created_at can't slip behind the checkpoint.
+    """
+    signed = _signed_amount()
+    settled = Transaction.created_at < horizon
+
+    joined = Transaction.wallet_id == Wallet.id
+    if not full:
+        joined = and_(
+            joined,
+            or_(
+                WalletCheckpoint.last_transaction_at.is_(None),
+                Transaction.created_at > WalletCheckpoint.last_transaction_at,
+            ),
+        )
+
+    rows = db.session.execute(
+        select(
+            Wallet.id,
+            Wallet.balance,
+            WalletCheckpoint.balance.label("checkpoint_balance"),
+            WalletCheckpoint.last_transaction_at,
+            func.coalesce(func.sum(signed), 0).label("delta"),
+            func.coalesce(func.sum(case((settled, signed), else_=0)), 0).label(
+                "settled_delta"
+            ),
+            func.max(case((settled, Transaction.created_at))).label("settled_until"),
+            func.count(Transaction.id).label("scanned"),
+        )
+        .outerjoin(WalletCheckpoint, WalletCheckpoint.wallet_id == Wallet.id)
+        .outerjoin(Transaction, joined)
+        .where(Wallet.id.in_(wallet_ids))
+        .group_by(
+            Wallet.id,
+            Wallet.balance,
+            WalletCheckpoint.balance,
+            WalletCheckpoint.last_transaction_at,
+        )
+    ).all()
+
+    now = datetime.now(timezone.utc)
+    drifts = []
+    checkpoints = []
+    for row in rows:
+        base = Decimal(0) if full else Decimal(row.checkpoint_balance or 0)
+        expected = base + Decimal(row.delta)
+        drift = Decimal(row.balance) - expected
+        if drift:
+            drifts.append(
+                {
+                    "wallet_id": row.id,
+                    "balance": Decimal(row.balance),
+                    "expected": expected,
+                    "drift": drift,
+                }
+            )
+
+        last_transaction_at = row.settled_until
+        if last_transaction_at is None and not full:
+            last_transaction_at = row.last_transaction_at
+        checkpoints.append(
+            {
+                "wallet_id": row.id,
+                "balance": base + Decimal(row.settled_delta),
+                "last_transaction_at": last_transaction_at,
+                "drift": drift,
+                "checked_at": now,
+            }
+        )
+
+    if checkpoints:
+        stmt = dialect_insert(WalletCheckpoint.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["wallet_id"],
+            set_={
+                column: stmt.excluded[column]
+                for column in ("balance", "last_transaction_at", "drift", "checked_at")
+            },
+        )
+        db.session.execute(stmt, checkpoints)
+        db.session.commit()
+
+    return drifts, sum(row.scanned for row in rows)
+
+
+def reconcile(chunk_size=500, workers=4, lag_seconds=300, full=False):
+    """Reconcile every wallet, `workers` chunks at a time.
+
+    Returns a report with the number of wallets checked, transactions
+    scanned and the list of drifting wallets.
+    """
+    app = current_app._get_current_object()
+    horizon = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(
+        seconds=lag_seconds
+    )
+
+    def run(wallet_ids):
+        # each worker thread gets its own app context, hence its own session
+        with app.app_context():
+            return len(wallet_ids), *reconcile_chunk(wallet_ids, horizon, full)
+
+    report = {"wallets": 0, "scanned": 0, "drifts": []}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for checked, drifts, scanned in executor.map(run, _wallet_chunks(chunk_size)):
+            report["wallets"] += checked
+            report["scanned"] += scanned
+            report["drifts"].extend(drifts)
+    return report
@@ -4,118 +4,161 @@ Description : Handle transactions creation and record
 Author      : @tonybnya
 """
 
-from flask import Blueprint, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from users.models import Wallet, Transaction, User
-from utils import make_response
+from flask import Blueprint, request, abort, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity, current_user
+from users.models import Wallet, Transaction, generate_id
+from utils import EXPORT_FORMATS, make_response, parse_date_arg, stream_export
 from auth.decorators import admin_required
+from core.replica import read_replica
+from wallets.conditional import not_modified, wallet_etag, wallet_state, with_etag
 from core import db
+import base64
+import binascii
+import uuid
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
+from sqlalchemy import select, tuple_
+from .analytics import GRANULARITIES, daily_report, summarize
+from .idempotency import idempotent
+from .ledger import (
+    credit,
+    credit_many,
+    debit,
+    record_transactions,
+    lock_wallets,
+    run_with_retry,
+    retry_stats,
+    WalletNotFound,
+    InsufficientBalance,
+    ConcurrencyConflict,
+)
 
 tx_bp = Blueprint("transaction", __name__, url_prefix="/transactions")
 
 VALID_TRANSACTION_TYPES = ["DEPOSIT", "WITHDRAWAL", "TRANSFER_IN", "TRANSFER_OUT"]
+BATCH_MODES = ["all_or_nothing", "best_effort"]
+CONFLICT_ERROR = "Too many concurrent updates on this wallet, please retry"
+# balances are Numeric(20, 2): larger amounts can't be stored
+AMOUNT_LIMIT = Decimal("1e18")
+
+
+def parse_amount(value):
+    """(Decimal amount, None), or (None, error) when `value` isn't a valid amount."""
+    try:
+        amount = Decimal(str(value))
+    except (ValueError, TypeError, ArithmeticError):
+        return None, "Invalid amount"
+    if not amount.is_finite():
+        return None, "Invalid amount"
+    if amount <= 0:
+        return None, "Amount must be positive"
+    if amount >= AMOUNT_LIMIT:
+        return None, "Amount is too large"
+    return amount, None
 
 
 @tx_bp.route("/deposit", methods=["POST"])
 @jwt_required()
+@idempotent
 def deposit():
     """Deposit money into a wallet."""
     current_user_id = get_jwt_identity()
-    current_user = User.query.get(current_user_id)
     data = request.get_json()
 
     if not data or "amount" not in data:
         return make_response(error="Missing required fields", status=400)
 
-    try:
-        amount = Decimal(str(data["amount"]))
-        if amount <= 0:
-            return make_response(error="Amount must be positive", status=400)
-    except (ValueError, TypeError):
-        return make_response(error="Invalid amount", status=400)
+    amount, error = parse_amount(data["amount"])
+    if error:
+        return make_response(error=error, status=400)
 
     if not current_user.is_admin and "user_id" in data:
         return make_response(error="Cannot deposit to other users", status=403)
 
     target_user_id = data.get("user_id", current_user_id)
-    wallet = Wallet.query.filter_by(user_id=target_user_id).first_or_404()
 
-    try:
-        wallet.balance += amount
+    def apply_deposit():
+        wallet_id, new_balance = credit(target_user_id, amount)
 
-        new_tx = Transaction(
-            wallet_id=wallet.id, amount=amount, transaction_type="DEPOSIT"
+        (new_tx,) = record_transactions(
+            [{"wallet_id": wallet_id, "amount": amount, "transaction_type": "DEPOSIT"}]
         )
 
-        db.session.add(new_tx)
-        db.session.commit()
+        return {
+            "transaction_id": new_tx["id"],
+            "new_balance": new_balance,
+            "amount_deposited": amount,
+        }
 
-        return make_response(
-            data={
-                "transaction_id": new_tx.id,
-                "new_balance": float(wallet.balance),
-                "amount_deposited": float(amount),
-            },
-            status=201,
-        )
+    try:
+        result = run_with_retry(apply_deposit)
+    except WalletNotFound:
+        db.session.rollback()
+        abort(404)
+    except ConcurrencyConflict:
+        return make_response(error=CONFLICT_ERROR, status=409)
     except Exception as e:
         db.session.rollback()
         return make_response(error=str(e), status=400)
 
+    # built once the money moved: nothing past the commit may turn into a 400
+    return make_response(data=result, status=201)
+
 
 @tx_bp.route("/withdraw", methods=["POST"])
 @jwt_required()
+@idempotent
 def withdraw():
     """Withdraw money from a wallet."""
     current_user_id = get_jwt_identity()
-    current_user = User.query.get(current_user_id)
     data = request.get_json()
 
     if not data or "amount" not in data:
         return make_response(error="Missing required fields", status=400)
 
-    try:
-        amount = Decimal(str(data["amount"]))
-        if amount <= 0:
-            return make_response(error="Amount must be positive", status=400)
-    except (ValueError, TypeError):
-        return make_response(error="Invalid amount", status=400)
+    amount, error = parse_amount(data["amount"])
+    if error:
+        return make_response(error=error, status=400)
 
     if not current_user.is_admin and "user_id" in data:
         return make_response(error="Cannot withdraw from other users", status=403)
 
     target_user_id = data.get("user_id", current_user_id)
-    wallet = Wallet.query.filter_by(user_id=target_user_id).first_or_404()
 
-    if wallet.balance < amount:
-        return make_response(error="Insufficient balance", status=400)
+    def apply_withdrawal():
+        wallet_id, new_balance = debit(target_user_id, amount)
 
-    try:
-        wallet.balance -= amount
-
-        new_tx = Transaction(
-            wallet_id=wallet.id, amount=amount, transaction_type="WITHDRAWAL"
+        (new_tx,) = record_transactions(
+            [{"wallet_id": wallet_id, "amount": amount, "transaction_type": "WITHDRAWAL"}]
         )
 
-        db.session.add(new_tx)
-        db.session.commit()
+        return {
+            "transaction_id": new_tx["id"],
+            "new_balance": new_balance,
+            "amount_withdrawn": amount,
+        }
 
-        return make_response(
-            data={
-                "transaction_id": new_tx.id,
-                "new_balance": float(wallet.balance),
-                "amount_withdrawn": float(amount),
-            },
-            status=201,
-        )
+    try:
+        result = run_with_retry(apply_withdrawal)
+    except WalletNotFound:
+        db.session.rollback()
+        abort(404)
+    except InsufficientBalance:
+        db.session.rollback()
+        return make_response(error="Insufficient balance", status=400)
+    except ConcurrencyConflict:
+        return make_response(error=CONFLICT_ERROR, status=409)
     except Exception as e:
         db.session.rollback()
         return make_response(error=str(e), status=400)
 
+    # built once the money moved: nothing past the commit may turn into a 400
+    return make_response(data=result, status=201)
+
 
 @tx_bp.route("/transfer", methods=["POST"])
 @jwt_required()
+@idempotent
 def transfer():
     """Transfer money between wallets."""
     current_user_id = get_jwt_identity()
@@ -125,53 +168,261 @@ def transfer():
     if not data or not all(field in data for field in required_fields):
         return make_response(error="Missing required fields", status=400)
 
+    if not isinstance(data["to_user_id"], str):
+        return make_response(error="Invalid to_user_id", status=400)
+
     if data["to_user_id"] == current_user_id:
         return make_response(error="Cannot transfer to same wallet", status=400)
 
-    try:
-        amount = Decimal(str(data["amount"]))
-        if amount <= 0:
-            return make_response(error="Amount must be positive", status=400)
-    except (ValueError, TypeError):
-        return make_response(error="Invalid amount", status=400)
+    amount, error = parse_amount(data["amount"])
+    if error:
+        return make_response(error=error, status=400)
 
-    from_wallet = Wallet.query.filter_by(user_id=current_user_id).first_or_404()
-    to_wallet = Wallet.query.filter_by(user_id=data["to_user_id"]).first_or_404()
+    to_user_id = data["to_user_id"]
 
-    if from_wallet.balance < amount:
-        return make_response(error="Insufficient balance", status=400)
+    def apply_transfer():
+        # lock both wallets up front, in id order, before touching balances
+        if len(lock_wallets(current_user_id, to_user_id)) < 2:
+            raise WalletNotFound()
+
+        from_wallet_id, from_balance = debit(current_user_id, amount)
+        to_wallet_id, to_balance = credit(to_user_id, amount)
+
+        transfer_out, transfer_in = record_transactions(
+            [
+                {
+                    "wallet_id": from_wallet_id,
+                    "amount": amount,
+                    "transaction_type": "TRANSFER_OUT",
+                },
+                {
+                    "wallet_id": to_wallet_id,
+                    "amount": amount,
+                    "transaction_type": "TRANSFER_IN",
+                },
+            ]
+        )
+
+        return {
+            "transfer_out_id": transfer_out["id"],
+            "transfer_in_id": transfer_in["id"],
+            "amount_transferred": amount,
+            "from_wallet_balance": from_balance,
+            "to_wallet_balance": to_balance,
+        }
 
     try:
-        from_wallet.balance -= amount
-        to_wallet.balance += amount
+        result = run_with_retry(apply_transfer)
+    except WalletNotFound:
+        db.session.rollback()
+        abort(404)
+    except InsufficientBalance:
+        db.session.rollback()
+        return make_response(error="Insufficient balance", status=400)
+    except ConcurrencyConflict:
+        return make_response(error=CONFLICT_ERROR, status=409)
+    except Exception as e:
+        db.session.rollback()
+        return make_response(error=str(e), status=400)
+
+    # built once the money moved: nothing past the commit may turn into a 400
+    return make_response(data=result)
+
+
+class BatchRejected(Exception):
+    """An all-or-nothing batch had at least one failing item."""
+
+    def __init__(self, error, results):
+        super().__init__(error)
+        self.error = error
+        self.results = results
+
+
+@tx_bp.route("/transfer/batch", methods=["POST"])
+@jwt_required()
+@idempotent
+def transfer_batch():
+    """Transfer money from the current wallet to many wallets at once."""
+    current_user_id = get_jwt_identity()
+    data = request.get_json()
 
-        transfer_out = Transaction(
-            wallet_id=from_wallet.id, amount=amount, transaction_type="TRANSFER_OUT"
+    if not data or not isinstance(data.get("transfers"), list) or not data["transfers"]:
+        return make_response(error="Missing required fields: transfers", status=400)
+
+    mode = data.get("mode", BATCH_MODES[0])
+    if mode not in BATCH_MODES:
+        return make_response(
+            error=f"Invalid mode. Valid modes: {', '.join(BATCH_MODES)}", status=400
+        )
+
+    max_items = current_app.config["BATCH_TRANSFER_MAX_ITEMS"]
+    if len(data["transfers"]) > max_items:
+        return make_response(
+            error=f"A batch can hold at most {max_items} transfers", status=400
+        )
+
+    results = []
+    for index, item in enumerate(data["transfers"]):
+        result = {
+            "index": index,
+            "to_user_id": None,
+            "amount": None,
+            "status": "failed",
+            "error": None,
+        }
+        results.append(result)
+
+        if not isinstance(item, dict) or "to_user_id" not in item or "amount" not in item:
+            result["error"] = "Missing required fields"
+            continue
+        if not isinstance(item["to_user_id"], str):
+            result["error"] = "Invalid to_user_id"
+            continue
+        result["to_user_id"] = item["to_user_id"]
+
+        amount, error = parse_amount(item["amount"])
+        if error:
+            result["error"] = error
+            continue
+        result["amount"] = amount
+
+        if item["to_user_id"] == current_user_id:
+            result["error"] = "Cannot transfer to same wallet"
+
+    validation_errors = [result["error"] for result in results]
+    if mode == "all_or_nothing" and any(validation_errors):
+        for result in results:
+            if result["error"] is None:
+                result["status"] = "skipped"
+        return make_response(
+            data={"mode": mode, "results": results},
+            error="Invalid transfer in batch",
+            status=400,
+        )
+
+    def reject_or_skip(error):
+        if mode == "all_or_nothing":
+            raise BatchRejected(error, results)
+
+    def apply_batch():
+        # start from the validation outcome, a retried attempt must not see
+        # the decisions of the one that was rolled back
+        for result, error in zip(results, validation_errors):
+            result["status"] = "pending" if error is None else "failed"
+            result["error"] = error
+            result.pop("transfer_out_id", None)
+            result.pop("transfer_in_id", None)
+
+        pending = [result for result in results if result["status"] == "pending"]
+        wallets = lock_wallets(
+            current_user_id, *{result["to_user_id"] for result in pending}
         )
-        transfer_in = Transaction(
-            wallet_id=to_wallet.id, amount=amount, transaction_type="TRANSFER_IN"
+        if current_user_id not in wallets:
+            raise WalletNotFound()
+
+        # greedy, in request order: every item that still fits is accepted
+        available = wallets[current_user_id].balance
+        accepted = []
+        for result in pending:
+            if result["to_user_id"] not in wallets:
+                result["error"] = "Wallet not found"
+            elif result["amount"] > available:
+                result["error"] = "Insufficient balance"
+            else:
+                available -= result["amount"]
+                accepted.append(result)
+                continue
+            result["status"] = "failed"
+            reject_or_skip(result["error"])
+
+        if not accepted:
+            db.session.rollback()
+            return None
+
+        from_wallet_id, from_balance = debit(
+            current_user_id, sum(result["amount"] for result in accepted)
         )
 
-        db.session.add(transfer_out)
-        db.session.add(transfer_in)
-        db.session.commit()
+        credits = {}
+        rows = []
+        for result in accepted:
+            to_wallet_id = wallets[result["to_user_id"]].id
+            credits[to_wallet_id] = credits.get(to_wallet_id, 0) + result["amount"]
 
+            result["transfer_out_id"] = generate_id()
+            result["transfer_in_id"] = generate_id()
+            rows.append(
+                {
+                    "id": result["transfer_out_id"],
+                    "wallet_id": from_wallet_id,
+                    "amount": result["amount"],
+                    "transaction_type": "TRANSFER_OUT",
+                }
+            )
+            rows.append(
+                {
+                    "id": result["transfer_in_id"],
+                    "wallet_id": to_wallet_id,
+                    "amount": result["amount"],
+                    "transaction_type": "TRANSFER_IN",
+                }
+            )
+
+        credit_many(credits)
+        record_transactions(rows)
+
+        for result in accepted:
+            result["status"] = "success"
+        return from_balance
+
+    try:
+        from_balance = run_with_retry(apply_batch)
+    except BatchRejected as e:
+        db.session.rollback()
+        for result in e.results:
+            if result["status"] == "pending":
+                result["status"] = "skipped"
         return make_response(
-            data={
-                "transfer_out_id": transfer_out.id,
-                "transfer_in_id": transfer_in.id,
-                "amount_transferred": float(amount),
-                "from_wallet_balance": float(from_wallet.balance),
-                "to_wallet_balance": float(to_wallet.balance),
-            }
+            data={"mode": mode, "results": e.results},
+            error=e.error,
+            status=400,
         )
+    except WalletNotFound:
+        db.session.rollback()
+        abort(404)
+    except InsufficientBalance:
+        db.session.rollback()
+        return make_response(error="Insufficient balance", status=400)
+    except ConcurrencyConflict:
+        return make_response(error=CONFLICT_ERROR, status=409)
     except Exception as e:
         db.session.rollback()
         return make_response(error=str(e), status=400)
 
+    succeeded = [result for result in results if result["status"] == "success"]
+    return make_response(
+        data={
+            "mode": mode,
+            "amount_transferred": sum(
+                (result["amount"] for result in succeeded), Decimal("0")
+            ),
+            "from_wallet_balance": from_balance,
+            "results": results,
+        },
+        count=len(succeeded),
+    )
+
+
+@tx_bp.route("/stats", methods=["GET"])
+@admin_required
+def get_ledger_stats():
+    """Get retry counters of the money-moving endpoints (admin only)."""
+    return make_response(data=dict(retry_stats))
+
 
 @tx_bp.route("/all", methods=["GET"])
 @admin_required
+@read_replica
 def get_all_transactions():
     """Get all transactions globally (admin only)."""
     page = request.args.get("page", 1, type=int)
@@ -193,33 +444,61 @@ def get_all_transactions():
     if tx_type:
         query = query.filter_by(transaction_type=tx_type)
 
-    pagination = query.order_by(Transaction.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    try:
+        items, pagination = _paginate(query, page, per_page)
+    except ValueError:
+        return make_response(error="Invalid cursor", status=400)
 
     return make_response(
         data=[
             {
                 "id": tx.id,
                 "wallet_id": tx.wallet_id,
-                "amount": float(tx.amount),
+                "amount": tx.amount,
                 "type": tx.transaction_type,
                 "created_at": tx.created_at.isoformat(),
             }
-            for tx in pagination.items
+            for tx in items
         ],
-        count=len(pagination.items),
-        pagination={
-            "page": pagination.page,
-            "per_page": pagination.per_page,
-            "total": pagination.total,
-            "total_pages": pagination.pages,
-        },
+        count=len(items),
+        pagination=pagination,
+    )
+
+
+@tx_bp.route("/report", methods=["GET"])
+@admin_required
+@read_replica
+def get_daily_report():
+    """Get transaction count and volume per day and type (admin only)."""
+    try:
+        today = datetime.now(timezone.utc).replace(tzinfo=None)
+        date_to = parse_date_arg("to") or today
+        date_from = parse_date_arg("from") or date_to - timedelta(days=30)
+    except ValueError:
+        return make_response(error="Invalid date, expected YYYY-MM-DD", status=400)
+
+    if date_from > date_to:
+        return make_response(error="from must not be after to", status=400)
+
+    rows = daily_report(date_from.date(), date_to.date())
+
+    return make_response(
+        data=[
+            {
+                "day": str(day),
+                "type": tx_type,
+                "count": count,
+                "amount": amount,
+            }
+            for day, tx_type, count, amount in rows
+        ],
+        count=len(rows),
     )
 
 
 @tx_bp.route("/me", methods=["GET"])
 @jwt_required()
+@read_replica
 def get_my_transactions():
     """Get all transactions for current user's wallet."""
     current_user_id = get_jwt_identity()
@@ -238,48 +517,89 @@ def get_my_transactions():
             status=400,
         )
 
-    wallet = Wallet.query.filter_by(user_id=current_user_id).first_or_404()
+    wallet = wallet_state(current_user_id)
+    if wallet is None:
+        abort(404)
+
+    etag = wallet_etag(wallet)
+    cached = not_modified(etag)
+    if cached:
+        return cached
 
     query = Transaction.query.filter_by(wallet_id=wallet.id)
     if tx_type:
         query = query.filter_by(transaction_type=tx_type)
 
-    pagination = query.order_by(Transaction.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    try:
+        items, pagination = _paginate(query, page, per_page)
+    except ValueError:
+        return make_response(error="Invalid cursor", status=400)
 
-    return make_response(
+    response = make_response(
         data={
             "wallet_id": wallet.id,
-            "current_balance": float(wallet.balance),
+            "current_balance": wallet.balance,
             "transactions": [
                 {
                     "id": tx.id,
-                    "amount": float(tx.amount),
+                    "amount": tx.amount,
                     "type": tx.transaction_type,
                     "created_at": tx.created_at.isoformat(),
                 }
-                for tx in pagination.items
+                for tx in items
             ],
         },
-        count=len(pagination.items),
-        pagination={
-            "page": pagination.page,
-            "per_page": pagination.per_page,
-            "total": pagination.total,
-            "total_pages": pagination.pages,
-        },
+        count=len(items),
+        pagination=pagination,
         status=200,
     )
+    return with_etag(response, etag)
+
+
+@tx_bp.route("/me/summary", methods=["GET"])
+@jwt_required()
+@read_replica
+def get_my_summary():
+    """Get revenue, spending and net of the current wallet per date bucket."""
+    current_user_id = get_jwt_identity()
+    granularity = request.args.get("granularity", "month")
+    months = request.args.get("months", 6, type=int)
+
+    if granularity not in GRANULARITIES:
+        return make_response(
+            error=f"Invalid granularity. Valid values: {', '.join(GRANULARITIES)}",
+            status=400,
+        )
+    if months < 1 or months > 24:
+        return make_response(error="months must be between 1 and 24", status=400)
+
+    wallet = Wallet.query.filter_by(user_id=current_user_id).first_or_404()
+    start, buckets = summarize(wallet.id, granularity, months)
+
+    zero = Decimal("0")
+    totals = {"revenue": zero, "spending": zero, "net": zero, "count": 0}
+    for bucket in buckets:
+        for field in ("revenue", "spending", "net", "count"):
+            totals[field] += bucket[field]
+
+    return make_response(
+        data={
+            "wallet_id": wallet.id,
+            "current_balance": wallet.balance,
+            "granularity": granularity,
+            "from": start.isoformat(),
+            "buckets": buckets,
+            "totals": totals,
+        },
+        count=len(buckets),
+    )
 
 
 @tx_bp.route("/<string:user_id>", methods=["GET"])
 @jwt_required()
+@read_replica
 def get_user_transactions(user_id):
     """Get all transactions for a user's wallet."""
-    current_user_id = get_jwt_identity()
-    current_user = User.query.get(current_user_id)
-
     if current_user.id != user_id and not current_user.is_admin:
         return make_response(error="Unauthorized", status=403)
 
@@ -304,42 +624,36 @@ def get_user_transactions(user_id):
     if tx_type:
         query = query.filter_by(transaction_type=tx_type)
 
-    pagination = query.order_by(Transaction.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    try:
+        items, pagination = _paginate(query, page, per_page)
+    except ValueError:
+        return make_response(error="Invalid cursor", status=400)
 
     return make_response(
         data={
             "wallet_id": wallet.id,
-            "current_balance": float(wallet.balance),
+            "current_balance": wallet.balance,
             "transactions": [
                 {
                     "id": tx.id,
-                    "amount": float(tx.amount),
+                    "amount": tx.amount,
                     "type": tx.transaction_type,
                     "created_at": tx.created_at.isoformat(),
                 }
-                for tx in pagination.items
+                for tx in items
             ],
         },
-        count=len(pagination.items),
-        pagination={
-            "page": pagination.page,
-            "per_page": pagination.per_page,
-            "total": pagination.total,
-            "total_pages": pagination.pages,
-        },
+        count=len(items),
+        pagination=pagination,
         status=200,
     )
 
 
 @tx_bp.route("/<string:user_id>/all", methods=["GET"])
 @jwt_required()
+@read_replica
 def get_user_all_transactions(user_id):
     """Get all transactions for a user's wallet without pagination."""
-    current_user_id = get_jwt_identity()
-    current_user = User.query.get(current_user_id)
-
     if current_user.id != user_id and not current_user.is_admin:
         return make_response(error="Unauthorized", status=403)
 
@@ -362,11 +676,11 @@ def get_user_all_transactions(user_id):
     return make_response(
         data={
             "wallet_id": wallet.id,
-            "current_balance": float(wallet.balance),
+            "current_balance": wallet.balance,
             "transactions": [
                 {
                     "id": tx.id,
-                    "amount": float(tx.amount),
+                    "amount": tx.amount,
                     "type": tx.transaction_type,
                     "created_at": tx.created_at.isoformat(),
                 }
@@ -375,3 +689,122 @@ def get_user_all_transactions(user_id):
         },
         count=len(transactions),
     )
+
+
+@tx_bp.route("/<string:user_id>/export", methods=["GET"])
+@jwt_required()
+@read_replica
+def export_user_transactions(user_id):
+    """Stream the full history of a user's wallet as NDJSON or CSV."""
+    if current_user.id != user_id and not current_user.is_admin:
+        return make_response(error="Unauthorized", status=403)
+
+    export_format = request.args.get("format", "ndjson")
+    tx_type = request.args.get("type")
+
+    if export_format not in EXPORT_FORMATS:
+        return make_response(
+            error=f"Invalid format. Valid formats: {', '.join(EXPORT_FORMATS)}",
+            status=400,
+        )
+
+    if tx_type and tx_type not in VALID_TRANSACTION_TYPES:
+        return make_response(
+            error=f"Invalid transaction type. Valid types: {', '.join(VALID_TRANSACTION_TYPES)}",
+            status=400,
+        )
+
+    try:
+        date_from = parse_date_arg("from")
+        date_to = parse_date_arg("to", end_of_day=True)
+    except ValueError:
+        return make_response(
+            error="Invalid date, expected ISO 8601 (YYYY-MM-DD[THH:MM:SS])",
+            status=400,
+        )
+
+    wallet = Wallet.query.filter_by(user_id=user_id).first_or_404()
+
+    stmt = select(
+        Transaction.id,
+        Transaction.amount,
+        Transaction.transaction_type,
+        Transaction.created_at,
+    ).where(Transaction.wallet_id == wallet.id)
+    if tx_type:
+        stmt = stmt.where(Transaction.transaction_type == tx_type)
+    if date_from:
+        stmt = stmt.where(Transaction.created_at >= date_from)
+    if date_to:
+        stmt = stmt.where(Transaction.created_at < date_to)
+    stmt = stmt.order_by(Transaction.created_at.desc(), Transaction.id.desc())
+
+    return stream_export(
+        stmt,
+        export_format,
+        ["id", "amount", "type", "created_at"],
+        lambda tx: {
+            "id": tx.id,
+            "amount": tx.amount,
+            "type": tx.transaction_type,
+            "created_at": tx.created_at.isoformat(),
+        },
+        f"transactions_{wallet.id}",
+    )
+
+
+def _encode_cursor(tx):
+    raw = f"{tx.created_at.isoformat()},{tx.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, tx_id = raw.split(",", 1)
+        return datetime.fromisoformat(created_at), str(uuid.UUID(tx_id))
+    except (UnicodeError, binascii.Error) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def _paginate(query, page, per_page):
+    """Page through `query` newest first, return (items, pagination).
+
+    Without `cursor` this is the classic OFFSET pagination with a total.
+    With `cursor` (empty for the first page) it seeks past the
+    (created_at, id) of the last row seen, so every page costs the same
+    index range scan; the COUNT(*) only runs with `include_total=true`.
+    """
+    ordered = (Transaction.created_at.desc(), Transaction.id.desc())
+    cursor = request.args.get("cursor")
+
+    if cursor is None:
+        pagination = query.order_by(*ordered).paginate(
+            page=page, per_page=per_page, error_out=False
+        )
+        return pagination.items, {
+            "page": pagination.page,
+            "per_page": pagination.per_page,
+            "total": pagination.total,
+            "total_pages": pagination.pages,
+        }
+
+    keyset = query
+    if cursor:
+        created_at, tx_id = _decode_cursor(cursor)
+        keyset = keyset.filter(
+            tuple_(Transaction.created_at, Transaction.id) < (created_at, tx_id)
+        )
+
+    items = keyset.order_by(*ordered).limit(per_page + 1).all()
+    has_more = len(items) > per_page
+    items = items[:per_page]
+
+    pagination = {
+        "per_page": per_page,
+        "has_more": has_more,
+        "next_cursor": _encode_cursor(items[-1]) if has_more else None,
+    }
+    if request.args.get("include_total", "false").lower() in ("1", "true"):
+        pagination["total"] = query.order_by(None).count()
+    return items, pagination
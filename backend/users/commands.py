@@ -0,0 +1,147 @@
+"""
+Script Name : commands.py
+Description : Flask CLI commands for users maintenance
+Author      : @tonybnya
+"""
+
+import json
+import time
+import click
+from flask.cli import with_appcontext
+from .id_migration import migrate_ids as run_migrate_ids
+from .importer import import_users as run_import, parse_csv
+from .search import build_search_index as build
+from .seed import seed as run_seed
+
+
+@click.command("build-search-index")
+@with_appcontext
+def build_search_index():
+    """Create and backfill the user search index on an existing database."""
+    build()
+    click.echo("User search index is ready")
+
+
+@click.command("import-users")
+@click.argument("path", type=click.File("rb"))
+@with_appcontext
+def import_users(path):
+    """Create users from a CSV file or a JSON list, without the request cap."""
+    start = time.perf_counter()
+    if path.name.endswith(".json"):
+        rows = json.load(path)
+        if isinstance(rows, dict):
+            rows = rows.get("users")
+        if not isinstance(rows, list):
+            raise click.ClickException("Expected a JSON list of users")
+    else:
+        try:
+            rows = parse_csv(path.read())
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+    report = run_import(rows)
+    for entry in report:
+        if entry["status"] != "created":
+            click.echo(f"  row {entry['row']}: {entry['error']}")
+    created = sum(1 for entry in report if entry["status"] == "created")
+    click.echo(
+        f"Imported {created}/{len(report)} users "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+
+
+@click.command("seed")
+@click.option("--users", default=1000, show_default=True, help="Regular users to create.")
+@click.option(
+    "--transactions",
+    default=10000,
+    show_default=True,
+    help="Approximate number of transaction rows.",
+)
+@click.option("--merchants", default=20, show_default=True, help="Hot merchant wallets.")
+@click.option(
+    "--merchant-share",
+    default=0.7,
+    show_default=True,
+    help="Share of the transfers that pay a merchant.",
+)
+@click.option("--years", default=3, show_default=True, help="Time span of the activity.")
+@click.option("--batch-size", default=5000, show_default=True, help="Rows per INSERT.")
+@click.option("--chunk-size", default=5000, show_default=True, help="Users per chunk.")
+@click.option(
+    "--workers",
+    default=1,
+    show_default=True,
+    help="Processes inserting chunks in parallel (ignored on SQLite).",
+)
+@click.option(
+    "--password",
+    default="password123",
+    show_default=True,
+    help="Password of every generated user.",
+)
+@click.option("--seed", "random_seed", type=int, help="Seed, for a reproducible dataset.")
+@click.option(
+    "--skip-daily-stats",
+    is_flag=True,
+    help="Don't fill wallet_daily_stats, run rebuild-daily-stats later.",
+)
+@with_appcontext
+def seed(
+    users,
+    transactions,
+    merchants,
+    merchant_share,
+    years,
+    batch_size,
+    chunk_size,
+    workers,
+    password,
+    random_seed,
+    skip_daily_stats,
+):
+    """Fill the database with synthetic users, wallets and transactions."""
+    start = time.perf_counter()
+
+    def progress(summary):
+        click.echo(
+            f"  {summary['users']}/{users} users, "
+            f"{summary['transactions']} transactions"
+        )
+
+    summary = run_seed(
+        users=users,
+        transactions=transactions,
+        merchants=merchants,
+        merchant_share=merchant_share,
+        years=years,
+        batch_size=batch_size,
+        chunk_size=chunk_size,
+        workers=workers,
+        password=password,
+        seed=random_seed,
+        daily_stats=not skip_daily_stats,
+        progress=progress,
+    )
+    elapsed = time.perf_counter() - start
+    click.echo(
+        f"Seeded {summary['users']} users, {summary['merchants']} merchants and "
+        f"{summary['transactions']} transactions in {elapsed:.1f}s "
+        f"(seed {summary['seed']})"
+    )
+    if skip_daily_stats:
+        click.echo("Run `flask rebuild-daily-stats` before using the summaries")
+
+
+@click.command("migrate-ids")
+@with_appcontext
+def migrate_ids():
+    """Convert the id columns of an existing database to UUID storage."""
+    counts = run_migrate_ids()
+    if counts is None:
+        click.echo("Ids are already stored as UUIDs")
+        return
+    for table, rows in counts.items():
+        click.echo(f"  {table}: {rows} rows")
+    click.echo("Id columns converted, new rows get UUIDv7 ids")
@@ -0,0 +1,146 @@
+"""
+Script Name : id_migration.py
+Description : Convert the String(36) id columns of an existing database to UUID storage
+Author      : @tonybnya
+"""
+
+import uuid
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.schema import AddConstraint
+from sqlalchemy.types import LargeBinary
+from core import db
+from .models import UUIDType
+
+
+def _id_tables():
+    """{table: [names of its UUID columns]}, parents before children."""
+    return {
+        table: columns
+        for table in db.metadata.sorted_tables
+        if (
+            columns := [
+                column.name
+                for column in table.columns
+                if isinstance(column.type, UUIDType)
+            ]
+        )
+    }
+
+
+def needs_migration(engine):
+    """True while users.id is still stored as text."""
+    inspector = inspect(engine)
+    if not inspector.has_table("users"):
+        return False
+    column = next(c for c in inspector.get_columns("users") if c["name"] == "id")
+    if engine.dialect.name == "postgresql":
+        return column["type"].__class__.__name__.upper() != "UUID"
+    return not isinstance(column["type"], LargeBinary)
+
+
+def _migrate_postgresql(engine, tables):
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        # the key and its references must change type together
+        for table in tables:
+            for fk in inspector.get_foreign_keys(table.name):
+                conn.execute(
+                    text(f'ALTER TABLE {table.name} DROP CONSTRAINT "{fk["name"]}"')
+                )
+        for table, columns in tables.items():
+            changes = ", ".join(
+                f"ALTER COLUMN {name} TYPE uuid USING {name}::uuid" for name in columns
+            )
+            conn.execute(text(f"ALTER TABLE {table.name} {changes}"))
+        for table in tables:
+            for fk in table.foreign_key_constraints:
+                conn.execute(AddConstraint(fk))
+        return {
+            table.name: conn.scalar(select(func.count()).select_from(table))
+            for table in tables
+        }
+
+
+def _uuid_bytes(value):
+    return None if value is None else uuid.UUID(value).bytes
+
+
+def _migrate_sqlite(engine, tables):
+    # SQLite can't change a column type: every table is rebuilt and copied
+    counts = {}
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("PRAGMA foreign_keys = OFF")
+        conn.connection.driver_connection.create_function(
+            "uuid_bytes", 1, _uuid_bytes, deterministic=True
+        )
+        conn.exec_driver_sql("BEGIN")
+        try:
+            # the search triggers would follow users to its new name
+            triggers = conn.exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                "AND tbl_name = 'users'"
+            ).scalars().all()
+            for trigger in triggers:
+                conn.exec_driver_sql(f"DROP TRIGGER {trigger}")
+            conn.exec_driver_sql("DROP TABLE IF EXISTS users_fts")
+
+            for table in tables:
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {table.name} RENAME TO {table.name}_v4"
+                )
+                indexes = conn.exec_driver_sql(
+                    "SELECT name FROM sqlite_master WHERE type = 'index' "
+                    "AND tbl_name = ? AND sql IS NOT NULL",
+                    (f"{table.name}_v4",),
+                ).scalars().all()
+                for index in indexes:
+                    conn.exec_driver_sql(f"DROP INDEX {index}")
+
+            # recreates the search index and its triggers too
+            db.metadata.create_all(conn, tables=list(tables))
+
+            for table, columns in tables.items():
+                names = [column.name for column in table.columns]
+                values = [
+                    f"uuid_bytes({name})" if name in columns else name for name in names
+                ]
+                counts[table.name] = conn.exec_driver_sql(
+                    f"INSERT INTO {table.name} ({', '.join(names)}) "
+                    f"SELECT {', '.join(values)} FROM {table.name}_v4"
+                ).rowcount
+            for table in reversed(list(tables)):
+                conn.exec_driver_sql(f"DROP TABLE {table.name}_v4")
+
+            if conn.exec_driver_sql("PRAGMA foreign_key_check").first() is not None:
+                raise RuntimeError("Dangling foreign keys after the copy")
+            conn.exec_driver_sql("COMMIT")
+        except Exception:
+            conn.exec_driver_sql("ROLLBACK")
+            raise
+        finally:
+            conn.exec_driver_sql("PRAGMA foreign_keys = ON")
+    return counts
+
+
+def migrate_ids():
+    """Move every id column to native UUID (Postgres) or 16-byte BLOB (SQLite).
+
+    Existing rows keep their ids, the uuid4 ones stay valid UUIDs, so
+    issued tokens and ids known to clients still resolve; only new rows
+    get time-ordered UUIDv7 ids. Runs in one database transaction. Returns
+    {table: rows}, or None when the database was already migrated.
+    """
+    engine = db.engine
+    if not needs_migration(engine):
+        return None
+    db.session.remove()  # no pooled connection may hold the old schema
+
+    tables = _id_tables()
+    if engine.dialect.name == "postgresql":
+        counts = _migrate_postgresql(engine, tables)
+    elif engine.dialect.name == "sqlite":
+        counts = _migrate_sqlite(engine, tables)
+    else:
+        raise RuntimeError(f"No id migration for {engine.dialect.name}")
+    engine.dispose()
+    return counts
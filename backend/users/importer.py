@@ -0,0 +1,178 @@
+"""
+Script Name : importer.py
+Description : Bulk creation of users and their wallets
+Author      : @tonybnya
+"""
+
+import csv
+import io
+from datetime import datetime, timezone
+from flask import current_app
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from core import db
+from utils import hash_passwords
+from .models import User, Wallet, generate_id
+
+REQUIRED_FIELDS = ["firstname", "lastname", "username", "email", "password"]
+# fields stored as-is, checked against their column length so an oversized
+# value fails its row instead of the whole batch insert
+STORED_FIELDS = ["firstname", "lastname", "username", "email"]
+
+
+def parse_csv(content):
+    """Rows of a UTF-8 CSV import, ValueError when it can't be decoded."""
+    try:
+        text = content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise ValueError("CSV file must be UTF-8 encoded")
+    return list(csv.DictReader(io.StringIO(text)))
+
+
+def _too_long(row):
+    """The first stored field longer than its column, or None."""
+    for field in STORED_FIELDS:
+        limit = User.__table__.c[field].type.length
+        if len(row[field]) > limit:
+            return f"{field} must be at most {limit} characters long"
+    return None
+
+
+def _validate(rows):
+    """Build the per-row report, flagging rows that can't be created."""
+    report = []
+    seen_usernames = set()
+    seen_emails = set()
+
+    for index, row in enumerate(rows):
+        entry = {
+            "row": index,
+            "username": None,
+            "status": "failed",
+            "id": None,
+            "error": None,
+        }
+        report.append(entry)
+
+        if not isinstance(row, dict) or not all(row.get(f) for f in REQUIRED_FIELDS):
+            entry["error"] = f"Missing required fields: {', '.join(REQUIRED_FIELDS)}"
+            continue
+        if not all(isinstance(row[f], str) for f in REQUIRED_FIELDS):
+            entry["error"] = f"Fields must be strings: {', '.join(REQUIRED_FIELDS)}"
+            continue
+
+        entry["username"] = row["username"]
+        too_long = _too_long(row)
+        if too_long:
+            entry["error"] = too_long
+        elif len(row["password"]) < 8:
+            entry["error"] = "Password must be at least 8 characters long"
+        elif row["username"] in seen_usernames:
+            entry["error"] = "Duplicate username in import"
+        elif row["email"] in seen_emails:
+            entry["error"] = "Duplicate email in import"
+        else:
+            entry["status"] = "pending"
+
+        seen_usernames.add(row["username"])
+        seen_emails.add(row["email"])
+
+    return report
+
+
+def _flag_existing(rows, report):
+    """Flag rows clashing with existing users, in one set-based query."""
+    pending = [rows[entry["row"]] for entry in report if entry["status"] == "pending"]
+    if not pending:
+        return
+
+    existing = db.session.execute(
+        select(User.username, User.email).where(
+            or_(
+                User.username.in_({row["username"] for row in pending}),
+                User.email.in_({row["email"] for row in pending}),
+            )
+        )
+    ).all()
+    usernames = {row.username for row in existing}
+    emails = {row.email for row in existing}
+
+    for entry in report:
+        if entry["status"] != "pending":
+            continue
+        row = rows[entry["row"]]
+        if row["username"] in usernames:
+            entry.update(status="failed", error="Username already exists")
+        elif row["email"] in emails:
+            entry.update(status="failed", error="Email already exists")
+
+
+def _insert_batch(users, wallets):
+    db.session.execute(insert(User), users)
+    db.session.execute(insert(Wallet), wallets)
+
+
+def import_users(rows):
+    """Create users with an empty wallet each, return the per-row report.
+
+    Rows are validated and checked against existing usernames/emails up
+    front, passwords are hashed across a process pool, then users and
+    wallets are bulk-inserted and committed batch by batch. A batch that
+    hits a concurrent insert is replayed row by row, so only the clashing
+    rows fail.
+    """
+    config = current_app.config
+    report = _validate(rows)
+    _flag_existing(rows, report)
+
+    pending = [entry for entry in report if entry["status"] == "pending"]
+    hashes = hash_passwords(
+        [rows[entry["row"]]["password"] for entry in pending],
+        workers=config["USER_IMPORT_HASH_WORKERS"] or None,
+    )
+
+    now = datetime.now(timezone.utc)
+    batch_size = config["USER_IMPORT_BATCH_SIZE"]
+    for start in range(0, len(pending), batch_size):
+        batch = []
+        for entry, password_hash in zip(
+            pending[start : start + batch_size], hashes[start : start + batch_size]
+        ):
+            row = rows[entry["row"]]
+            user_id = generate_id()
+            user = {
+                "id": user_id,
+                "firstname": row["firstname"],
+                "lastname": row["lastname"],
+                "username": row["username"],
+                "email": row["email"],
+                "password_hash": password_hash,
+                "is_active": True,
+                "is_admin": False,
+                "created_at": now,
+            }
+            wallet = {"id": generate_id(), "user_id": user_id, "created_at": now}
+            batch.append((entry, user, wallet))
+
+        try:
+            _insert_batch([user for _, user, _ in batch], [w for _, _, w in batch])
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            for entry, user, wallet in batch:
+                try:
+                    _insert_batch([user], [wallet])
+                    db.session.commit()
+                except IntegrityError:
+                    db.session.rollback()
+                    entry.update(
+                        status="failed", error="Username or email already exists"
+                    )
+                    continue
+                entry.update(status="created", id=user["id"])
+            continue
+
+        for entry, user, _ in batch:
+            entry.update(status="created", id=user["id"])
+
+    return report
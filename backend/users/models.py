@@ -4,16 +4,86 @@ Description : Define resource models for users, wallets, and transactions
 Author      : @tonybnya
 """
 
+import os
+import threading
+import time
 import uuid
 from core import db
 from datetime import datetime, timezone
-from utils import hash_password, verify_password
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.types import LargeBinary, TypeDecorator
+from utils import hash_password, verify_password, password_needs_rehash
+
+_id_lock = threading.Lock()
+_id_last_ms = 0
+_id_counter = 0
+
+
+def generate_id():
+    """A UUIDv7 (RFC 9562): a 48-bit Unix ms timestamp, then random bits.
+
+    Ids sort by creation time, so inserts append to the right edge of the
+    primary key indexes instead of landing on random pages. Within one
+    millisecond the 12 bits after the version count up, so the ids of a
+    process stay strictly increasing.
+    """
+    global _id_last_ms, _id_counter
+    with _id_lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _id_last_ms:
+            _id_last_ms = now_ms
+            # random start, leaving room to count up
+            _id_counter = int.from_bytes(os.urandom(2)) & 0x7FF
+        else:
+            # same millisecond, or the clock stepped back
+            _id_counter += 1
+            if _id_counter > 0xFFF:
+                _id_last_ms += 1
+                _id_counter = 0
+        timestamp, counter = _id_last_ms, _id_counter
+
+    random_bits = int.from_bytes(os.urandom(8)) & ((1 << 62) - 1)
+    # unix_ts_ms | ver (7) | rand_a (counter) | var (0b10) | rand_b
+    value = (
+        (timestamp << 80) | (0x7 << 76) | (counter << 64) | (0b10 << 62) | random_bits
+    )
+    return str(uuid.UUID(int=value))
+
+
+class UUIDType(TypeDecorator):
+    """A UUID, native on Postgres and 16 bytes elsewhere, a str in Python.
+
+    A malformed value binds as NULL, so looking up an id taken from a URL
+    or a request body finds no row instead of failing on Postgres.
+    """
+
+    impl = LargeBinary(16)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=False))
+        return dialect.type_descriptor(LargeBinary(16))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            value = value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+        except ValueError:
+            return None
+        return str(value) if dialect.name == "postgresql" else value.bytes
+
+    def process_result_value(self, value, dialect):
+        if value is None or dialect.name == "postgresql":
+            return value
+        return str(uuid.UUID(bytes=bytes(value)))
 
 
 class User(db.Model):
     __tablename__ = "users"
 
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = db.Column(UUIDType, primary_key=True, default=generate_id)
     firstname = db.Column(db.String(80), nullable=False)
     lastname = db.Column(db.String(80), nullable=False)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -39,7 +109,7 @@ class User(db.Model):
             "is_admin": self.is_admin,
             "wallet": {
                 "id": self.wallet.id,
-                "balance": float(self.wallet.balance),
+                "balance": self.wallet.balance,
                 "currency": self.wallet.currency,
             }
             if self.wallet
@@ -59,29 +129,46 @@ class User(db.Model):
         """Verify the user's password."""
         return verify_password(password, self.password_hash)
 
+    def rehash_password_if_needed(self, password):
+        """Re-hash a verified password when the bcrypt cost changed."""
+        if not password_needs_rehash(self.password_hash):
+            return False
+        self.password_hash = hash_password(password)
+        return True
+
 
 class Wallet(db.Model):
     __tablename__ = "wallets"
 
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = db.Column(UUIDType, primary_key=True, default=generate_id)
     balance = db.Column(db.Numeric(20, 2), default=0.00, nullable=False)
     currency = db.Column(db.String(3), default="XAF", nullable=False)
+    # bumped on every balance change, the wallet ETags derive from it; ORM
+    # flushes check it too, see LEDGER_LOCK_MODE = "optimistic"
+    version = db.Column(db.Integer, default=1, server_default="1", nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
     # Foreign Key
     user_id = db.Column(
-        db.String(36), db.ForeignKey("users.id"), nullable=False, unique=True
+        UUIDType, db.ForeignKey("users.id"), nullable=False, unique=True
     )
 
     # Relationship: One Wallet -> Many Transactions
     transactions = db.relationship(
         "Transaction", backref="wallet", lazy=True, cascade="all, delete-orphan"
     )
+    daily_stats = db.relationship(
+        "WalletDailyStat", lazy=True, cascade="all, delete-orphan"
+    )
+    checkpoint = db.relationship(
+        "WalletCheckpoint", uselist=False, cascade="all, delete-orphan"
+    )
 
     # Constraint: Balance can't be negative
     __table_args__ = (
         db.CheckConstraint("balance >= 0", name="check_balance_non_negative"),
     )
+    __mapper_args__ = {"version_id_col": version}
 
     def __repr__(self):
         return f"<Wallet user={self.user_id} balance={self.balance}>"
@@ -90,14 +177,80 @@ class Wallet(db.Model):
 class Transaction(db.Model):
     __tablename__ = "transactions"
 
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = db.Column(UUIDType, primary_key=True, default=generate_id)
     amount = db.Column(db.Numeric(20, 2), nullable=False)
     # 'DEPOSIT' or 'WITHDRAWAL' or 'TRANSFER_OUT' or 'TRANSFER_IN'
     transaction_type = db.Column(db.String(15), nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
     # Foreign Key
-    wallet_id = db.Column(db.String(36), db.ForeignKey("wallets.id"), nullable=False)
+    wallet_id = db.Column(UUIDType, db.ForeignKey("wallets.id"), nullable=False)
+
+    # History is always read newest first, per wallet or globally
+    __table_args__ = (
+        db.Index("ix_transactions_wallet_created_id", "wallet_id", "created_at", "id"),
+        db.Index("ix_transactions_created_id", "created_at", "id"),
+    )
 
     def __repr__(self):
         return f"<Transaction {self.id} {self.amount}>"
+
+
+class WalletDailyStat(db.Model):
+    """Per wallet, per day and per type rollup of the transactions table."""
+
+    __tablename__ = "wallet_daily_stats"
+
+    wallet_id = db.Column(UUIDType, db.ForeignKey("wallets.id"), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    transaction_type = db.Column(db.String(15), primary_key=True)
+    count = db.Column(db.Integer, default=0, nullable=False)
+    amount = db.Column(db.Numeric(20, 2), default=0.00, nullable=False)
+
+    # Cross-wallet reports read a day range
+    __table_args__ = (db.Index("ix_wallet_daily_stats_day", "day"),)
+
+    def __repr__(self):
+        return f"<WalletDailyStat {self.wallet_id} {self.day} {self.transaction_type}>"
+
+
+class WalletCheckpoint(db.Model):
+    """Signed sum of a wallet's transactions up to `last_transaction_at`."""
+
+    __tablename__ = "wallet_checkpoints"
+
+    wallet_id = db.Column(UUIDType, db.ForeignKey("wallets.id"), primary_key=True)
+    balance = db.Column(db.Numeric(20, 2), default=0.00, nullable=False)
+    last_transaction_at = db.Column(db.DateTime, nullable=True)
+    drift = db.Column(db.Numeric(20, 2), default=0.00, nullable=False)
+    checked_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f"<WalletCheckpoint {self.wallet_id} balance={self.balance}>"
+
+
+class IdempotencyKey(db.Model):
+    __tablename__ = "idempotency_keys"
+
+    id = db.Column(UUIDType, primary_key=True, default=generate_id)
+    key = db.Column(db.String(255), nullable=False)
+    endpoint = db.Column(db.String(120), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)
+    # both stay NULL while the first request is still in flight
+    status_code = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    # Foreign Key
+    user_id = db.Column(
+        UUIDType, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "key", name="uq_idempotency_user_key"),
+        db.Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
+
+    def __repr__(self):
+        return f"<IdempotencyKey {self.key} user={self.user_id}>"
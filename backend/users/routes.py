@@ -4,16 +4,36 @@ Description : Definition of the users routes
 Author      : @tonybnya
 """
 
-from flask import Blueprint, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from .models import User
+from flask import Blueprint, current_app, request
+from flask_jwt_extended import jwt_required, get_jwt_identity, current_user
+from .models import User, Wallet
+from .importer import import_users as run_import, parse_csv
+from .search import search_users as search_users_index
 from core import db
-from utils import make_response
+from utils import EXPORT_FORMATS, make_response, parse_date_arg, stream_export
 from auth.decorators import admin_required
+from core.replica import read_replica
+from auth.identity import user_cache
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 
 users_bp = Blueprint("user", __name__, url_prefix="/users")
 
+EXPORT_FIELDS = [
+    "id",
+    "username",
+    "email",
+    "firstname",
+    "lastname",
+    "is_active",
+    "is_admin",
+    "created_at",
+    "wallet_id",
+    "balance",
+    "currency",
+]
+
 
 @users_bp.route("", methods=["POST"])
 def create_user():
@@ -123,6 +143,7 @@ def create_admin():
 
 @users_bp.route("", methods=["GET"])
 @admin_required
+@read_replica
 def read_users():
     page = request.args.get("page", 1, type=int)
     per_page = request.args.get("per_page", 20, type=int)
@@ -132,8 +153,10 @@ def read_users():
     if per_page < 1 or per_page > 100:
         return make_response(error="per_page must be between 1 and 100", status=400)
 
-    pagination = User.query.order_by(User.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
+    pagination = (
+        User.query.options(joinedload(User.wallet))
+        .order_by(User.created_at.desc())
+        .paginate(page=page, per_page=per_page, error_out=False)
     )
 
     return make_response(
@@ -150,18 +173,14 @@ def read_users():
 
 @users_bp.route("/search", methods=["GET"])
 @jwt_required()
+@read_replica
 def search_users():
     query_str = request.args.get("q", "")
     if len(query_str) < 3:
         return make_response(data=[], count=0)
     
-    users = User.query.filter(
-        (User.username.ilike(f"%{query_str}%")) | 
-        (User.email.ilike(f"%{query_str}%")) |
-        (User.firstname.ilike(f"%{query_str}%")) |
-        (User.lastname.ilike(f"%{query_str}%"))
-    ).limit(10).all()
-    
+    users = search_users_index(query_str)
+
     return make_response(
         data=[{
             "id": user.id,
@@ -176,32 +195,96 @@ def search_users():
 
 @users_bp.route("/all", methods=["GET"])
 @admin_required
+@read_replica
 def read_all_users():
-    users = User.query.order_by(User.created_at.desc()).all()
-    return make_response(data=[user.to_dict() for user in users], count=len(users))
+    rows = db.session.execute(
+        _user_listing().order_by(User.created_at.desc())
+    ).all()
+    return make_response(data=[_listing_dict(row) for row in rows], count=len(rows))
+
+
+@users_bp.route("/export", methods=["GET"])
+@admin_required
+@read_replica
+def export_users():
+    """Stream every user with their wallet balance as NDJSON or CSV."""
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in EXPORT_FORMATS:
+        return make_response(
+            error=f"Invalid format. Valid formats: {', '.join(EXPORT_FORMATS)}",
+            status=400,
+        )
+
+    try:
+        is_active = _parse_bool_arg("is_active")
+        is_admin = _parse_bool_arg("is_admin")
+        date_from = parse_date_arg("from")
+        date_to = parse_date_arg("to", end_of_day=True)
+    except ValueError as e:
+        return make_response(error=str(e), status=400)
+
+    stmt = _user_listing().add_columns(User.created_at)
+    if is_active is not None:
+        stmt = stmt.where(User.is_active == is_active)
+    if is_admin is not None:
+        stmt = stmt.where(User.is_admin == is_admin)
+    if date_from:
+        stmt = stmt.where(User.created_at >= date_from)
+    if date_to:
+        stmt = stmt.where(User.created_at < date_to)
+    stmt = stmt.order_by(User.created_at.desc(), User.id)
+
+    return stream_export(
+        stmt,
+        export_format,
+        EXPORT_FIELDS,
+        lambda row: {field: getattr(row, field) for field in EXPORT_FIELDS},
+        "users",
+    )
+
+
+@users_bp.route("/import", methods=["POST"])
+@admin_required
+def import_users():
+    """Create many users from a CSV upload or a JSON list, with a per-row report."""
+    try:
+        rows = _read_import_rows()
+    except ValueError as e:
+        return make_response(error=str(e), status=400)
+
+    max_rows = current_app.config["USER_IMPORT_MAX_ROWS"]
+    if not rows:
+        return make_response(error="No users to import", status=400)
+    if len(rows) > max_rows:
+        return make_response(
+            error=f"Cannot import more than {max_rows} users at once, "
+            "use the import-users command for larger files",
+            status=400,
+        )
+
+    report = run_import(rows)
+    created = sum(1 for entry in report if entry["status"] == "created")
+    return make_response(data=report, count=created, status=201 if created else 200)
 
 
 @users_bp.route("/me", methods=["GET"])
 @jwt_required()
 def read_current_user():
     user_id = get_jwt_identity()
-    user = User.query.get_or_404(user_id)
+    user = User.query.options(joinedload(User.wallet)).get_or_404(user_id)
     return make_response(data=user.to_dict())
 
 
 @users_bp.route("/<string:user_id>", methods=["GET"])
 @jwt_required()
 def read_user(user_id):
-    user = User.query.get_or_404(user_id)
+    user = User.query.options(joinedload(User.wallet)).get_or_404(user_id)
     return make_response(data=user.to_dict())
 
 
 @users_bp.route("/<string:user_id>", methods=["PUT"])
 @jwt_required()
 def update_user(user_id):
-    current_user_id = get_jwt_identity()
-    current_user = User.query.get(current_user_id)
-
     user = User.query.get_or_404(user_id)
 
     if current_user.id != user_id and not current_user.is_admin:
@@ -228,6 +311,7 @@ def update_user(user_id):
         user.set_password(password)
 
     db.session.commit()
+    user_cache.invalidate(user_id)
     return make_response(data=user.to_dict())
 
 
@@ -238,7 +322,73 @@ def delete_user(user_id):
         user = User.query.get_or_404(user_id)
         db.session.delete(user)
         db.session.commit()
+        user_cache.invalidate(user_id)
         return make_response(data={"message": "User deleted"}, status=200)
     except Exception as e:
         db.session.rollback()
         return make_response(error=str(e), status=400)
+
+
+def _user_listing():
+    """Users and their wallet in one LEFT JOIN, only the serialized columns."""
+    return select(
+        User.id,
+        User.firstname,
+        User.lastname,
+        User.username,
+        User.email,
+        User.is_active,
+        User.is_admin,
+        Wallet.id.label("wallet_id"),
+        Wallet.balance,
+        Wallet.currency,
+    ).outerjoin(Wallet, Wallet.user_id == User.id)
+
+
+def _listing_dict(row):
+    """Same shape as User.to_dict(), built from a `_user_listing()` row."""
+    return {
+        "id": row.id,
+        "firstname": row.firstname,
+        "lastname": row.lastname,
+        "username": row.username,
+        "email": row.email,
+        "is_active": row.is_active,
+        "is_admin": row.is_admin,
+        "wallet": {
+            "id": row.wallet_id,
+            "balance": row.balance,
+            "currency": row.currency,
+        }
+        if row.wallet_id
+        else None,
+    }
+
+
+def _parse_bool_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    if value.lower() in ("1", "true"):
+        return True
+    if value.lower() in ("0", "false"):
+        return False
+    raise ValueError(f"{name} must be true or false")
+
+
+def _read_import_rows():
+    """Rows of an import: a CSV file/body, or a JSON list (or {"users": [...]})."""
+    upload = request.files.get("file")
+    if upload is not None:
+        content = upload.read()
+    elif request.mimetype == "text/csv":
+        content = request.get_data()
+    else:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            data = data.get("users")
+        if not isinstance(data, list):
+            raise ValueError("Expected a CSV file or a JSON list of users")
+        return data
+
+    return parse_csv(content)
@@ -0,0 +1,153 @@
+"""
+Script Name : search.py
+Description : Indexed user search (pg_trgm on Postgres, FTS5 on SQLite)
+Author      : @tonybnya
+"""
+
+from sqlalchemy import case, column, event, func, literal_column, or_, select, table, text
+from core import db
+from .models import User
+
+SEARCH_COLUMNS = ("username", "email", "firstname", "lastname")
+
+_columns = ", ".join(SEARCH_COLUMNS)
+_new = ", ".join(f"new.{name}" for name in SEARCH_COLUMNS)
+_old = ", ".join(f"old.{name}" for name in SEARCH_COLUMNS)
+
+# FTS5 table keyed by users.id, kept in sync by triggers: users has no
+# INTEGER PRIMARY KEY, so its implicit rowids may change on VACUUM and can't
+# be shared with the index; the trigram tokenizer matches any substring of
+# 3+ characters, case-insensitively
+SQLITE_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+    f"user_id UNINDEXED, {_columns}, tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN "
+    f"INSERT INTO users_fts(user_id, {_columns}) VALUES (new.id, {_new}); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN "
+    "DELETE FROM users_fts WHERE user_id = old.id; END",
+    # only the searched columns: logins that rehash a password skip it
+    f"CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF id, {_columns} "
+    f"ON users BEGIN "
+    f"DELETE FROM users_fts WHERE user_id = old.id; "
+    f"INSERT INTO users_fts(user_id, {_columns}) VALUES (new.id, {_new}); END",
+]
+# earlier databases indexed users by rowid, build_search_index replaces it
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS users_fts_ai",
+    "DROP TRIGGER IF EXISTS users_fts_ad",
+    "DROP TRIGGER IF EXISTS users_fts_au",
+    "DROP TABLE IF EXISTS users_fts",
+]
+SQLITE_BACKFILL = (
+    f"INSERT INTO users_fts(user_id, {_columns}) SELECT id, {_columns} FROM users"
+)
+
+users_fts = table("users_fts", column("user_id"), column("rank"))
+_fts_ready = {}
+
+# trigram GIN indexes serve ILIKE '%q%' without a sequential scan
+POSTGRES_DDL = ["CREATE EXTENSION IF NOT EXISTS pg_trgm"] + [
+    f"CREATE INDEX IF NOT EXISTS ix_users_{name}_trgm "
+    f"ON users USING gin ({name} gin_trgm_ops)"
+    for name in SEARCH_COLUMNS
+]
+
+
+def _create_index(target, connection, **kw):
+    _fts_ready.clear()
+    if connection.dialect.name == "sqlite":
+        for statement in SQLITE_DDL:
+            connection.execute(text(statement))
+    elif connection.dialect.name == "postgresql":
+        for statement in POSTGRES_DDL:
+            connection.execute(text(statement))
+
+
+def _drop_index(target, connection, **kw):
+    _fts_ready.clear()
+    if connection.dialect.name == "sqlite":
+        connection.execute(text("DROP TABLE IF EXISTS users_fts"))
+
+
+event.listen(User.__table__, "after_create", _create_index)
+event.listen(User.__table__, "before_drop", _drop_index)
+
+
+def build_search_index():
+    """Create the search index on an existing database and backfill it.
+
+    On SQLite the index is dropped and rebuilt from scratch, which also
+    upgrades indexes created against the users rowid.
+    """
+    connection = db.session.connection()
+    if connection.dialect.name == "sqlite":
+        for statement in SQLITE_DROP:
+            connection.execute(text(statement))
+    _create_index(User.__table__, connection)
+    if connection.dialect.name == "sqlite":
+        connection.execute(text(SQLITE_BACKFILL))
+    db.session.commit()
+
+
+def _has_fts(connection):
+    # databases without the index, or with the rowid-based one, fall back
+    # to a LIKE scan until build-search-index runs
+    url = str(connection.engine.url)
+    if url not in _fts_ready:
+        _fts_ready[url] = (
+            connection.execute(
+                text(
+                    "SELECT 1 FROM sqlite_master m, pragma_table_info(m.name) c "
+                    "WHERE m.name = 'users_fts' AND c.name = 'user_id'"
+                )
+            ).first()
+            is not None
+        )
+    return _fts_ready[url]
+
+
+def _like_escape(query):
+    return query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_users(query, limit=10):
+    """Return users matching `query`, exact then prefix matches first."""
+    lowered = query.lower()
+    escaped = _like_escape(lowered)
+    columns = [getattr(User, name) for name in SEARCH_COLUMNS]
+
+    rank = case(
+        (
+            or_(func.lower(User.username) == lowered, func.lower(User.email) == lowered),
+            0,
+        ),
+        (
+            or_(*[func.lower(c).like(f"{escaped}%", escape="\\") for c in columns]),
+            1,
+        ),
+        else_=2,
+    )
+
+    stmt = select(User)
+    # the bind the query will run on: the replica for replica-routed requests
+    connection = db.session.connection(bind_arguments={"clause": stmt})
+    if connection.dialect.name == "sqlite" and _has_fts(connection):
+        phrase = '"' + query.replace('"', '""') + '"'
+        stmt = stmt.join(users_fts, users_fts.c.user_id == User.id).where(
+            literal_column("users_fts").op("MATCH")(phrase)
+        )
+        relevance = users_fts.c.rank  # bm25, lower is better
+    else:
+        stmt = stmt.where(
+            or_(*[c.ilike(f"%{escaped}%", escape="\\") for c in columns])
+        )
+        if connection.dialect.name == "postgresql":
+            relevance = func.greatest(
+                *[func.similarity(c, query) for c in columns]
+            ).desc()
+        else:
+            relevance = func.length(User.username)
+
+    return db.session.scalars(
+        stmt.order_by(rank, relevance, User.username).limit(limit)
+    ).all()
@@ -0,0 +1,382 @@
+"""
+Script Name : seed.py
+Description : Generate production-sized synthetic users, wallets and transactions
+Author      : @tonybnya
+"""
+
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from itertools import accumulate
+from faker import Faker
+from sqlalchemy import bindparam, create_engine, func, insert, select, update
+from core import db
+from utils import hash_password
+from .models import Transaction, User, Wallet, WalletDailyStat, generate_id
+
+# Pareto shape of the per-user activity: ~80% of the transactions come from
+# ~20% of the users, with a few whales far above the rest
+ACTIVITY_ALPHA = 1.16
+# share of each event type, transfers write two rows
+DEPOSIT_SHARE = 0.3
+WITHDRAWAL_SHARE = 0.2
+# log-normal amounts, in cents
+DEPOSIT_CENTS = (math.log(25_000_00), 1.0)
+SPENDING_CENTS = (math.log(8_000_00), 1.1)
+
+_worker_engine = None
+
+
+def _now():
+    # stored naive, like every other DateTime column of the app
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _amount(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def _cents(rng, mu_sigma):
+    return max(100, int(rng.lognormvariate(*mu_sigma)))
+
+
+def _insert(engine, table, rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        with engine.begin() as conn:
+            conn.execute(insert(table), rows[start : start + batch_size])
+
+
+def _add_stat(stats, wallet_id, created_at, tx_type, cents):
+    key = (wallet_id, created_at.date(), tx_type)
+    count, total = stats.get(key, (0, 0))
+    stats[key] = (count + 1, total + cents)
+
+
+def _stat_rows(stats):
+    return [
+        {
+            "wallet_id": wallet_id,
+            "day": day,
+            "transaction_type": tx_type,
+            "count": count,
+            "amount": _amount(cents),
+        }
+        for (wallet_id, day, tx_type), (count, cents) in sorted(stats.items())
+    ]
+
+
+def _profile(fake, index):
+    firstname = fake.first_name()
+    lastname = fake.last_name()
+    username = f"{fake.user_name()}{index}"
+    return {
+        "firstname": firstname,
+        "lastname": lastname,
+        "username": username,
+        "email": f"{username}@{fake.free_email_domain()}",
+    }
+
+
+def _create_merchants(engine, count, password_hash, now, years, fake, rng, offset):
+    """Insert the hot merchant wallets, return their ids most popular first.
+
+    They sign up within the month before the `years` of activity, so every
+    transfer paying them comes after their signup.
+    """
+    users, wallets = [], []
+    for i in range(count):
+        company = fake.company()
+        username = "".join(c for c in company.lower() if c.isalnum())[:60]
+        user_id = generate_id()
+        created_at = now - timedelta(days=365 * years + 1 + 29 * rng.random())
+        users.append(
+            {
+                "id": user_id,
+                "firstname": company[:80],
+                "lastname": "Merchant",
+                "username": f"{username}{offset + i}",
+                "email": f"{username}{offset + i}@{fake.domain_name()}",
+                "password_hash": password_hash,
+                "is_active": True,
+                "is_admin": False,
+                "created_at": created_at,
+            }
+        )
+        wallets.append(
+            {"id": generate_id(), "user_id": user_id, "created_at": created_at}
+        )
+    _insert(engine, User.__table__, users, 1000)
+    _insert(engine, Wallet.__table__, wallets, 1000)
+    return [wallet["id"] for wallet in wallets]
+
+
+def seed_chunk(engine, spec):
+    """Insert one chunk of users with their wallets and transactions.
+
+    Money only moves inside the chunk or to the merchant wallets, so each
+    wallet balance can be derived here from its own rows. Outgoing money is
+    checked against the sender's running balance without its incoming
+    transfers, which keeps every balance non-negative at every point in
+    time. A transfer to a user who signed up later is dated at that signup:
+    the sender's money only leaves later than checked, so that still holds.
+    Returns (users, transactions, merchant rollup) for the caller to
+    settle the merchant wallets, the rollup being {(wallet_id, day, type):
+    (count, cents)}.
+    """
+    rng = random.Random(f"{spec['seed']}-{spec['index']}")
+    fake = Faker()
+    fake.seed_instance(f"{spec['seed']}-{spec['index']}")
+    now = spec["now"]
+    span = timedelta(days=365 * spec["years"]).total_seconds()
+    merchants = spec["merchants"]
+    # Zipf-like: the first merchant gets twice the traffic of the second
+    merchant_weights = list(accumulate(1 / (k + 1) for k in range(len(merchants))))
+    batch_size = spec["batch_size"]
+
+    users, wallets, signups = [], [], []
+    for offset in range(len(spec["counts"])):
+        # recent signups outnumber old ones, the user base grows over time
+        signup = now - timedelta(seconds=span * rng.random() ** 2)
+        user = {
+            "id": generate_id(),
+            **_profile(fake, spec["start"] + offset),
+            "password_hash": spec["password_hash"],
+            "is_active": True,
+            "is_admin": False,
+            "created_at": signup,
+        }
+        users.append(user)
+        wallets.append(
+            {"id": generate_id(), "user_id": user["id"], "created_at": signup}
+        )
+        signups.append(signup)
+    _insert(engine, User.__table__, users, batch_size)
+    _insert(engine, Wallet.__table__, wallets, batch_size)
+
+    wallet_ids = [wallet["id"] for wallet in wallets]
+    signed_up = dict(zip(wallet_ids, signups))
+    balances = dict.fromkeys(wallet_ids, 0)
+    stats = {}
+    merchant_stats = {}
+    rows = []
+    inserted = 0
+
+    def add(wallet_id, cents, tx_type, created_at):
+        nonlocal inserted
+        rows.append(
+            {
+                "id": generate_id(),
+                "wallet_id": wallet_id,
+                "amount": _amount(cents),
+                "transaction_type": tx_type,
+                "created_at": created_at,
+            }
+        )
+        _add_stat(
+            stats if wallet_id in balances else merchant_stats,
+            wallet_id,
+            created_at,
+            tx_type,
+            cents,
+        )
+        if len(rows) >= batch_size:
+            _insert(engine, Transaction.__table__, rows, batch_size)
+            inserted += len(rows)
+            rows.clear()
+
+    for wallet_id, signup, events in zip(wallet_ids, signups, spec["counts"]):
+        lifetime = (now - signup).total_seconds()
+        # activity picks up towards today
+        moments = sorted(rng.random() ** 0.5 for _ in range(events))
+        own = 0  # balance without the incoming transfers
+        for moment in moments:
+            created_at = signup + timedelta(seconds=lifetime * moment)
+            kind = rng.random()
+            if kind >= DEPOSIT_SHARE and own >= 100:
+                cents = min(_cents(rng, SPENDING_CENTS), own)
+                if kind < DEPOSIT_SHARE + WITHDRAWAL_SHARE:
+                    add(wallet_id, cents, "WITHDRAWAL", created_at)
+                    own -= cents
+                    continue
+                if merchants and (
+                    len(wallet_ids) < 2 or rng.random() < spec["merchant_share"]
+                ):
+                    (to_wallet_id,) = rng.choices(merchants, cum_weights=merchant_weights)
+                elif len(wallet_ids) >= 2:
+                    to_wallet_id = wallet_id
+                    while to_wallet_id == wallet_id:
+                        to_wallet_id = rng.choice(wallet_ids)
+                else:
+                    to_wallet_id = None
+                if to_wallet_id is not None:
+                    # merchants signed up before the window, users may not have
+                    sent_at = max(created_at, signed_up.get(to_wallet_id, created_at))
+                    add(wallet_id, cents, "TRANSFER_OUT", sent_at)
+                    add(to_wallet_id, cents, "TRANSFER_IN", sent_at)
+                    own -= cents
+                    if to_wallet_id in balances:
+                        balances[to_wallet_id] += cents
+                    continue
+            # nothing to spend yet: money comes in first
+            cents = _cents(rng, DEPOSIT_CENTS)
+            add(wallet_id, cents, "DEPOSIT", created_at)
+            own += cents
+        balances[wallet_id] += own
+
+    if rows:
+        _insert(engine, Transaction.__table__, rows, batch_size)
+        inserted += len(rows)
+
+    table = Wallet.__table__
+    with engine.begin() as conn:
+        conn.execute(
+            update(table)
+            .where(table.c.id == bindparam("wallet_id"))
+            .values(balance=bindparam("new_balance")),
+            [
+                {"wallet_id": wallet_id, "new_balance": _amount(cents)}
+                for wallet_id, cents in balances.items()
+            ],
+        )
+    if spec["daily_stats"]:
+        _insert(engine, WalletDailyStat.__table__, _stat_rows(stats), batch_size)
+
+    return len(users), inserted, merchant_stats
+
+
+def _init_worker(database_uri):
+    global _worker_engine
+    _worker_engine = create_engine(database_uri)
+
+
+def _seed_chunk_in_worker(spec):
+    return seed_chunk(_worker_engine, spec)
+
+
+def _activity(rng, users, events):
+    """Events per user, heavy-tailed and summing to about `events`."""
+    weights = [rng.paretovariate(ACTIVITY_ALPHA) for _ in range(users)]
+    scale = events / sum(weights) if weights else 0
+    counts = []
+    for weight in weights:
+        expected = weight * scale
+        whole = int(expected)
+        counts.append(whole + (rng.random() < expected - whole))
+    return counts
+
+
+def seed(
+    users=1000,
+    transactions=10000,
+    merchants=20,
+    merchant_share=0.7,
+    years=3,
+    batch_size=5000,
+    chunk_size=5000,
+    workers=1,
+    password="password123",
+    seed=None,
+    daily_stats=True,
+    progress=None,
+):
+    """Generate `users` users plus `merchants` hot merchant wallets.
+
+    About `transactions` rows are spread over `years` years, users' activity
+    following a Pareto law and `merchant_share` of the transfers paying a
+    merchant. Rows go in through Core executemany inserts of `batch_size`,
+    chunks of `chunk_size` users run on `workers` processes. Balances always
+    match the transactions; wallet_daily_stats does too unless `daily_stats`
+    is False. Every user gets the same `password`. Returns a summary dict.
+    """
+    seed = random.randrange(2**32) if seed is None else seed
+    rng = random.Random(seed)
+    fake = Faker()
+    fake.seed_instance(seed)
+    engine = db.engine
+
+    if workers > 1 and engine.dialect.name == "sqlite":
+        # a single writer at a time anyway, processes would only queue
+        workers = 1
+
+    # one hash for everyone, bcrypt would otherwise dominate the run
+    password_hash = hash_password(password)
+    offset = db.session.scalar(select(func.count()).select_from(User)) or 0
+    db.session.commit()
+
+    now = _now()
+    merchant_ids = _create_merchants(
+        engine, merchants, password_hash, now, years, fake, rng, offset
+    )
+    offset += merchants
+
+    rows_per_event = 1 + (1 - DEPOSIT_SHARE - WITHDRAWAL_SHARE)
+    counts = _activity(rng, users, transactions / rows_per_event)
+    specs = [
+        {
+            "index": index,
+            "seed": seed,
+            "start": offset + start,
+            "counts": counts[start : start + chunk_size],
+            "merchants": merchant_ids,
+            "merchant_share": merchant_share,
+            "password_hash": password_hash,
+            "years": years,
+            "now": now,
+            "batch_size": batch_size,
+            "daily_stats": daily_stats,
+        }
+        for index, start in enumerate(range(0, users, chunk_size))
+    ]
+
+    if workers > 1:
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(engine.url.render_as_string(hide_password=False),),
+        )
+        results = pool.map(_seed_chunk_in_worker, specs)
+    else:
+        pool = None
+        results = (seed_chunk(engine, spec) for spec in specs)
+
+    summary = {"seed": seed, "users": 0, "merchants": merchants, "transactions": 0}
+    merchant_totals = {}
+    try:
+        for chunk_users, inserted, totals in results:
+            summary["users"] += chunk_users
+            summary["transactions"] += inserted
+            for key, (count, cents) in totals.items():
+                previous = merchant_totals.get(key, (0, 0))
+                merchant_totals[key] = (previous[0] + count, previous[1] + cents)
+            if progress:
+                progress(summary)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    # merchants only ever receive, their balance is the sum of the transfers in
+    merchant_balances = dict.fromkeys(merchant_ids, 0)
+    for (wallet_id, _, _), (_, cents) in merchant_totals.items():
+        merchant_balances[wallet_id] += cents
+    table = Wallet.__table__
+    if merchant_balances:
+        with engine.begin() as conn:
+            conn.execute(
+                update(table)
+                .where(table.c.id == bindparam("wallet_id"))
+                .values(balance=bindparam("new_balance")),
+                [
+                    {"wallet_id": wallet_id, "new_balance": _amount(cents)}
+                    for wallet_id, cents in merchant_balances.items()
+                ],
+            )
+    if daily_stats:
+        _insert(
+            engine,
+            WalletDailyStat.__table__,
+            _stat_rows(merchant_totals),
+            batch_size,
+        )
+    return summary
@@ -1,19 +1,141 @@
 """
 Script Name : utils.py
-Description : Helper to ensure every response follows the same structure
+Description : Password hashing helpers and the shared response structure
 Author      : @tonybnya
 """
 
+import csv
+import io
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
 import bcrypt
-from flask import jsonify
+from flask import current_app, has_app_context, jsonify, request, stream_with_context
+from core import db
+from core.metrics import registry
 
+DEFAULT_BCRYPT_ROUNDS = 12
+DEFAULT_BCRYPT_MAX_WORKERS = 4
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+}
+
+_executor = None
+_process_pools = {}
+_executor_lock = threading.Lock()
+
+
+def _config(key, default):
+    return current_app.config.get(key, default) if has_app_context() else default
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=_config("BCRYPT_MAX_WORKERS", DEFAULT_BCRYPT_MAX_WORKERS),
+                thread_name_prefix="bcrypt",
+            )
+        return _executor
+
+
+def _run_bcrypt(fn, *args):
+    """Run a bcrypt call on a bounded pool of OS threads.
+
+    bcrypt releases the GIL, so the request thread only waits for its own
+    hash while the other threads/greenlets of the worker keep serving, and
+    at most BCRYPT_MAX_WORKERS hashes burn CPU at once.
+    """
+    start = time.perf_counter()
+    try:
+        return _submit_bcrypt(fn, *args)
+    finally:
+        operation = "verify" if fn is bcrypt.checkpw else "hash"
+        registry.observe(
+            "paylite_bcrypt_seconds",
+            time.perf_counter() - start,
+            (("operation", operation),),
+        )
+
+
+def _gevent_patched():
+    # gevent is only imported by gunicorn.conf.py for the gevent workers
+    if "gevent" not in sys.modules:
+        return False
+    from gevent import monkey
+
+    return monkey.is_module_patched("threading")
+
+
+def _submit_bcrypt(fn, *args):
+    if _gevent_patched():
+        from gevent import get_hub
+
+        # patched threads are greenlets: use gevent's real thread pool
+        return get_hub().threadpool.apply(fn, args)
+    return _get_executor().submit(fn, *args).result()
+
+
+def hash_password(password: str, rounds: int | None = None) -> str:
+    rounds = rounds or _config("BCRYPT_ROUNDS", DEFAULT_BCRYPT_ROUNDS)
+    salt = bcrypt.gensalt(rounds=rounds)
+    return _run_bcrypt(bcrypt.hashpw, password.encode("utf-8"), salt).decode("utf-8")
 
 
 def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+    return _run_bcrypt(bcrypt.checkpw, password.encode("utf-8"), hashed.encode("utf-8"))
+
+
+def _hash_one(args):
+    password, rounds = args
+    salt = bcrypt.gensalt(rounds=rounds)
+    return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
+
+
+def _get_process_pool(workers):
+    # spawned, not forked: a fork of a threaded worker would copy locks held
+    # by the other request threads; kept for the life of the process so the
+    # interpreters start once
+    with _executor_lock:
+        if workers not in _process_pools:
+            _process_pools[workers] = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _process_pools[workers]
+
+
+def hash_passwords(passwords, rounds: int | None = None, workers: int | None = None):
+    """Hash many passwords across a process pool, in order.
+
+    Meant for batch jobs: every core works on its own share of the list
+    instead of queueing behind the request pool of `hash_password`.
+    """
+    rounds = rounds or _config("BCRYPT_ROUNDS", DEFAULT_BCRYPT_ROUNDS)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(passwords) < 2:
+        return [_hash_one((password, rounds)) for password in passwords]
+
+    chunksize = max(1, len(passwords) // (workers * 4))
+    pool = _get_process_pool(workers)
+    return list(
+        pool.map(_hash_one, [(p, rounds) for p in passwords], chunksize=chunksize)
+    )
+
+
+def password_needs_rehash(hashed: str, rounds: int | None = None) -> bool:
+    """Tell whether `hashed` was made with another cost than the configured one."""
+    rounds = rounds or _config("BCRYPT_ROUNDS", DEFAULT_BCRYPT_ROUNDS)
+    try:
+        return int(hashed.split("$")[2]) != rounds
+    except (IndexError, ValueError):
+        return True
 
 
 def make_response(data=None, count=0, error=None, status=200, pagination=None):
@@ -22,3 +144,54 @@ def make_response(data=None, count=0, error=None, status=200, pagination=None):
     if pagination:
         response["pagination"] = pagination
     return jsonify(response), status
+
+
+def parse_date_arg(name, end_of_day=False):
+    """Parse an ISO 8601 query arg, None when absent, ValueError when invalid."""
+    value = request.args.get(name)
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    # a bare date as upper bound includes that whole day
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def stream_export(stmt, export_format, fieldnames, to_record, filename):
+    """Stream the rows of `stmt` as an NDJSON or CSV attachment.
+
+    Rows come from a server-side cursor (yield_per=EXPORT_CHUNK_SIZE) and
+    each chunk is written out before the next is fetched, so memory stays
+    flat however many rows there are. `to_record` maps a row to a dict
+    keyed by `fieldnames`.
+    """
+    chunk_size = current_app.config["EXPORT_CHUNK_SIZE"]
+    dumps = current_app.json.dumps
+    mimetype, extension = EXPORT_FORMATS[export_format]
+
+    def generate():
+        result = db.session.execute(stmt.execution_options(yield_per=chunk_size))
+        if export_format == "csv":
+            yield ",".join(fieldnames) + "\n"
+        for rows in result.partitions():
+            buffer = io.StringIO()
+            if export_format == "csv":
+                writer = csv.DictWriter(buffer, fieldnames, lineterminator="\n")
+                for row in rows:
+                    record = to_record(row)
+                    for key, value in record.items():
+                        if isinstance(value, datetime):
+                            record[key] = value.isoformat()
+                    writer.writerow(record)
+            else:
+                for row in rows:
+                    buffer.write(dumps(to_record(row), sort_keys=False))
+                    buffer.write("\n")
+            yield buffer.getvalue()
+
+    return current_app.response_class(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}.{extension}"},
+    )
@@ -0,0 +1,52 @@
+"""
+Script Name : conditional.py
+Description : ETags derived from the wallet version, for conditional GETs
+Author      : @tonybnya
+"""
+
+import hashlib
+from flask import current_app, request
+from sqlalchemy import select
+from core import db
+from users.models import Wallet
+
+
+def wallet_state(user_id):
+    """Load (id, balance, currency, version) of the user's wallet, or None.
+
+    One lookup on the unique wallets.user_id index; it is all a conditional
+    GET needs to decide whether the client copy is still current.
+    """
+    return db.session.execute(
+        select(Wallet.id, Wallet.balance, Wallet.currency, Wallet.version).where(
+            Wallet.user_id == user_id
+        )
+    ).first()
+
+
+def wallet_etag(wallet):
+    """Strong ETag of the current request's representation of `wallet`.
+
+    Every balance change bumps the wallet version, so the version plus the
+    path and query args identify the response body exactly.
+    """
+    args = "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+    raw = f"{request.path}?{args}|{wallet.id}|{wallet.version}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def not_modified(etag):
+    """A 304 response when If-None-Match holds `etag`, None otherwise."""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = current_app.response_class(status=304)
+    return with_etag(response, etag)
+
+
+def with_etag(response, etag):
+    """Tag a response (or a make_response() tuple) with `etag`."""
+    body = response[0] if isinstance(response, tuple) else response
+    body.set_etag(etag)
+    # per user, and always revalidated: the balance can change at any time
+    body.headers["Cache-Control"] = "private, no-cache"
+    return response
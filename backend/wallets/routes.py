@@ -5,35 +5,45 @@ Author      : @tonybnya
 """
 
 from flask import Blueprint
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from users.models import Wallet, User
+from flask_jwt_extended import jwt_required, get_jwt_identity, current_user
+from users.models import Wallet
+from core.replica import read_replica
 from utils import make_response
+from .conditional import not_modified, wallet_etag, wallet_state, with_etag
 
 wallets_bp = Blueprint("wallet", __name__, url_prefix="/wallets")
 
 
 @wallets_bp.route("/me", methods=["GET"])
 @jwt_required()
+@read_replica
 def get_my_wallet():
     user_id = get_jwt_identity()
-    wallet = Wallet.query.filter_by(user_id=user_id).first()
+    wallet = wallet_state(user_id)
     if not wallet:
         return make_response(error="Wallet not found", status=404)
-    return make_response(
-        data={
-            "id": wallet.id,
-            "balance": float(wallet.balance),
-            "currency": wallet.currency,
-        }
+
+    etag = wallet_etag(wallet)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    return with_etag(
+        make_response(
+            data={
+                "id": wallet.id,
+                "balance": wallet.balance,
+                "currency": wallet.currency,
+            }
+        ),
+        etag,
     )
 
 
 @wallets_bp.route("/<string:user_id>", methods=["GET"])
 @jwt_required()
+@read_replica
 def get_wallet_balance(user_id):
-    current_user_id = get_jwt_identity()
-    current_user = User.query.get(current_user_id)
-
     if current_user.id != user_id and not current_user.is_admin:
         return make_response(error="Unauthorized", status=403)
 
@@ -41,7 +51,7 @@ def get_wallet_balance(user_id):
     return make_response(
         data={
             "id": wallet.id,
-            "balance": float(wallet.balance),
+            "balance": wallet.balance,
             "currency": wallet.currency,
         }
     )
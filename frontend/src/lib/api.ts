@@ -8,6 +8,11 @@ const api = axios.create({
   },
 });
 
+// Signed token the backend sends after a write, echoed so that our next
+// reads stay on the primary database until the replica has caught up
+const READ_PRIMARY_HEADER = "X-Read-Primary";
+let readPrimaryToken: string | null = null;
+
 // Add a request interceptor to attach the JWT token if it exists
 api.interceptors.request.use(
   (config) => {
@@ -15,6 +20,9 @@ api.interceptors.request.use(
     if (token) {
       config.headers.Authorization = `Bearer ${token}`;
     }
+    if (readPrimaryToken) {
+      config.headers[READ_PRIMARY_HEADER] = readPrimaryToken;
+    }
     return config;
   },
   (error) => {
@@ -22,4 +30,13 @@ api.interceptors.request.use(
   }
 );
 
+// Keep the latest read-primary token, the backend tells when it expired
+api.interceptors.response.use((response) => {
+  const readPrimary = response.headers[READ_PRIMARY_HEADER.toLowerCase()];
+  if (typeof readPrimary === "string") {
+    readPrimaryToken = readPrimary;
+  }
+  return response;
+});
+
 export default api;